@@ -6,6 +6,7 @@ import re
 import sys
 import shutil
 import traceback
+from functools import lru_cache
 from typing import Union
 from types import FunctionType
 from iikp import readchar, keys
@@ -29,6 +30,11 @@ if os.name == "nt":
             ("visible", ctypes.c_byte)
         ]
 
+# Tag patterns
+_TAG_PATTERN   = re.compile(r"\[(/?)([a-zA-Z]+)\]")  # [tag] and [/tag]
+_STRIP_PATTERN = re.compile(r"\[/*[a-zA-Z]+\]")
+_RENDER_CACHE  = 1024                                # Rendered fragments kept (prompts, prefixes)
+
 # Console class
 class Console(object):
     def __init__(self) -> None:
@@ -63,6 +69,10 @@ class Console(object):
         for _rs in [self._color_map["norm"], self._color_map["bgreset"]]:
             self._color_map["reset"] += _rs
 
+        # Tags are rendered (or stripped) in one pass; fragments that repeat, like
+        # prompts and prefixes, are cached, whole lines are unique so they never are
+        self.fragment = lru_cache(maxsize = _RENDER_CACHE)(self.fragment)
+
         self._regen_ts()
         self.hcursor()
 
@@ -73,11 +83,21 @@ class Console(object):
         self._size = shutil.get_terminal_size()
         self._ts = " " * self._size.columns
 
+    def _replace_tag(self, match: re.Match) -> str:
+        tag = match.group(2)
+        if tag not in self._color_map:
+            return match.group(0)
+
+        return self._color_map["reset"] if match.group(1) else self._color_map[tag]
+
+    def _render(self, text: str) -> str:
+        return _TAG_PATTERN.sub(self._replace_tag, text)
+
     def _strip_tags(self, text: str) -> str:
-        for tag in re.findall(r"\[\/*[a-zA-Z]{1,}\]", text):
-            text = text.replace(tag, "")
+        return _STRIP_PATTERN.sub("", text)
 
-        return text
+    def fragment(self, text: str) -> str:
+        return self._render(text)
 
     def clear(self) -> None:
         self._regen_ts()
@@ -88,10 +108,8 @@ class Console(object):
         if not color:
             return self._strip_tags(text)
 
-        # Process tags | TODO: Make a much better, recursive system
-        text += ("[reset]" if not text.endswith("[reset]") else "")
-        for tag in self._color_map:
-            text = text.replace(f"[{tag}]", self._color_map[tag]).replace(f"[/{tag}]", self._color_map["reset"])
+        # Process tags
+        text = self._render(text + ("[reset]" if not text.endswith("[reset]") else ""))
 
         if not print_out:
             return text
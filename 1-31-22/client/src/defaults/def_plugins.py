@@ -3,8 +3,11 @@
 
 # Modules
 import os
+import json
 import shutil
+import hashlib
 import textwrap
+from threading import Thread
 
 # Plugin Manager
 class PluginManager_(object):
@@ -37,7 +40,7 @@ class PluginManager_(object):
     def reload(self, args: list) -> None:
         if not args:
             self.loader.load_plugins()
-            return self.print(f"[green]Reloaded {len(self.loader.plugins) - 2} plugin(s)")
+            return self.print(f"[green]Reloaded {len(self.loader.plugins) - 3} plugin(s)")
 
         failed = 0
         for plugin in args:
@@ -108,6 +111,91 @@ class PluginManager_(object):
         else:
             return self.loader.print(f"[red]Unknown command: '{command}'.[reset]")
 
+# Channel manager
+class ChannelManager(object):
+    def __init__(self, loader) -> None:
+        self.loader = loader
+        self.plugin_id = "channel"
+
+        self.print = loader.print
+        self.cmap = {"help": self.help, "join": self.join, "leave": self.leave, "switch": self.switch, "list": self.list}
+
+        # Storage
+        self.joined = []
+        self.current = None  # Channel new messages are sent to (None for everyone)
+
+        # Metadata
+        self.name = "Plasma Channel Manager"
+        self.author = "iiPython"
+
+    def join(self, args: list) -> None:
+        if not args:
+            return self.print("[red]No channel specified to join.")
+
+        self.loader.sock.send_json({"type": "c.join", "data": {"name": args[0].lstrip("#")}})
+
+    def leave(self, args: list) -> None:
+        name = args[0].lstrip("#").lower() if args else self.current
+        if name is None:
+            return self.print("[red]No channel specified to leave.")
+
+        self.loader.sock.send_json({"type": "c.leave", "data": {"name": name}})
+
+    def switch(self, args: list) -> None:
+        if not args:
+            self.current = None
+            return self.print("[green]Now sending to everyone.")
+
+        name = args[0].lstrip("#").lower()
+        if name not in self.joined:
+            return self.print(f"[red]You haven't joined #{name}.")
+
+        self.current = name
+        return self.print(f"[green]Now sending to #{name}.")
+
+    def list(self, args: list) -> None:
+        if not self.joined:
+            return self.print("[yellow]You haven't joined any channels.")
+
+        self.print("[yellow]Joined channels:")
+        for name in self.joined:
+            self.print(f"  [blue]#{name}" + (" [lblack](sending here)" if name == self.current else ""))
+
+    def help(self, args: list) -> None:
+        cmds = ["join <channel>", "leave [channel]", "switch [channel]", "list"]
+        self.print("[yellow]Plasma Channel Manager[reset]\nCommands:\n" + "\n".join(["  " + f for f in cmds]))
+
+    def handle_resp(self, data) -> None:
+        if data.type == "e.channel":
+            return self.print(f"[red]{data.content}")
+
+        name = data.content["channel"]
+        if data.type == "c.joined":
+            if name not in self.joined:
+                self.joined.append(name)
+
+            self.current = name
+            return self.print(f"[green]Joined #{name}, now sending there.")
+
+        elif name in self.joined:
+            self.joined.remove(name)
+
+        if self.current == name:
+            self.current = None
+
+        self.print(f"[green]Left #{name}.")
+
+    def on_fire(self, args: list) -> None:
+        if not args:
+            return self.loader.print("[red]No command specified.[reset]")
+
+        command, args = args[0], args[1:]
+        if command in self.cmap:
+            return self.cmap[command](args)
+
+        else:
+            return self.loader.print(f"[red]Unknown command: '{command}'.[reset]")
+
 # File manager
 class FileManager(object):
     def __init__(self, loader) -> None:
@@ -115,14 +203,22 @@ class FileManager(object):
         self.plugin_id = "file"
 
         self.print = loader.print
-        self.cmap = {"help": self.help, "up": self.upload, "down": self.download, "workdir": self.workdir}
+        self.cmap = {"help": self.help, "up": self.upload, "down": self.download, "peek": self.peek, "workdir": self.workdir}
 
         # Storage
-        self.packsize = None
         self.awaiting = False
+        self.uploading = None
+        self.requested = None    # Download asked for, until d.begin
+        self.downloading = None
         self.filemeta = {}
         self.workdir  = os.path.abspath("./")
 
+        # Unfinished uploads and downloads (kept on disk, so they resume after a reconnect)
+        self.uploads_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), "../uploads.json")
+        self.uploads = self.read_json(self.uploads_file)
+        self.downloads_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), "../downloads.json")
+        self.downloads = self.read_json(self.downloads_file)
+
         # Metadata
         self.name = "Plasma File Manager"
         self.author = "iiPython"
@@ -147,55 +243,230 @@ class FileManager(object):
         self.workdir = path
         return self.print("[green]Working dir changed.")
 
+    def read_json(self, path: str) -> dict:
+        if not os.path.isfile(path):
+            return {}
+
+        try:
+            with open(path, "r") as file:
+                return json.loads(file.read())
+
+        except Exception:
+            return {}
+
+    def save_json(self, path: str, data: dict) -> None:
+        try:
+            with open(path, "w") as file:
+                file.write(json.dumps(data, indent = 4))
+
+        except OSError:
+            pass
+
+    def save_uploads(self) -> None:
+        self.save_json(self.uploads_file, self.uploads)
+
     def upload(self, args: list) -> None:
         if not args:
             return self.print("[red]No filename specified to upload.")
 
-        elif self.packsize is None:
-            return self.print("[red]No packet size is known, wait until a message is received.")
+        elif self.uploading is not None:
+            return self.print("[red]Wait for the current upload to finish first.")
 
         fn = os.path.join(self.workdir, args[0])
         if not os.path.isfile(fn):
             return self.print("[red]No such file exists.")
 
-        size = os.path.getsize(fn)
-        if size + 60 > self.packsize:
-            return self.print(f"[red]File too large, packet limit: {self.scale(self.packsize)}")
-
         fn = fn.replace("\\", "/")
-        with open(fn, "rb") as file:
-            data = file.read()
+        packet = {"name": fn.split("/")[-1], "size": os.path.getsize(fn)}
 
-        packet = {"type": "m.bin", "data": {"content": data.hex(), "name": fn.split("/")[-1]}}
-        if len(packet) > self.packsize:
+        # Pick up an interrupted upload where it left off (unless the file changed since)
+        previous = self.uploads.get(fn)
+        if previous is not None and [previous["size"], previous["mtime"]] == [packet["size"], os.path.getmtime(fn)]:
+            packet["id"] = previous["id"]
 
-            # Failsafe incase hex is larger than bytes
-            return self.print(f"[red]File too large, packet limit: {self.scale(self.packsize)}")
+        self.uploading = fn
+        self.loader.sock.send_json({"type": "f.begin", "data": packet})
 
-        # Send packet
-        self.loader.sock.send_json(packet)
+    def stream(self, fn: str, upload: str, index: int, chunk: int) -> None:
+        with open(fn, "rb") as file:
+            file.seek(index * chunk)
+            data = file.read(chunk)
+            while data and self.uploading == fn:
+                self.loader.sock.send_chunk(upload, index, data)
+                index, data = index + 1, file.read(chunk)
+
+        if self.uploading == fn:
+            self.loader.sock.send_json({"type": "f.end", "data": {"id": upload}})
 
-    def download(self, args: list) -> None:
+    def download(self, args: list, preview: int = None) -> None:
         if not args:
             return self.print("[red]No file ID provided to download.")
 
         elif len(args[0]) != 8:
             return self.print("[red]Invalid file ID.")
 
-        elif args[0] in self.filemeta and os.path.isfile(self.filemeta[args[0]]):
+        elif self.awaiting:
+            return self.print("[red]Wait for the current download to finish first.")
+
+        elif preview is None and args[0] in self.filemeta and os.path.isfile(self.filemeta[args[0]]):
             return self.print(f"[red]'{self.filemeta[args[0]]}' already exists locally.")
 
-        self.loader.sock.send_json({"type": "d.down", "data": {"id": args[0]}})
+        # Pick up an interrupted download where it left off
+        packet, previous = {"id": args[0]}, self.downloads.get(args[0])
+        if preview is not None:
+            packet |= {"offset": 0, "length": preview}
+
+        elif previous is not None and os.path.isfile(previous["path"] + ".part"):
+            packet["offset"] = os.path.getsize(previous["path"] + ".part")
+
+        self.requested = {"id": args[0], "preview": preview is not None}
+        self.loader.sock.send_json({"type": "d.down", "data": packet})
         self.awaiting = True
 
+    def peek(self, args: list) -> None:
+        if args[1:] and not args[1].isdigit():
+            return self.print("[red]Invalid byte count.")
+
+        return self.download(args[:1], preview = int(args[1]) if args[1:] else 512)
+
     def help(self, args: list) -> None:
-        cmds = ["up <file>", "down <id>", "workdir [dir]"]
+        cmds = ["up <file>", "down <id>", "peek <id> [bytes]", "workdir [dir]"]
         self.print("[yellow]Plasma File Manager[reset]\nCommands:\n" + "\n".join(["  " + f for f in cmds]))
 
+    def handle_upload(self, data) -> None:
+        fn = self.uploading
+        if fn is None:
+            return
+
+        elif data.type == "f.ready":
+            content = data.content
+            self.uploads[fn] = {"id": content["id"], "size": os.path.getsize(fn), "mtime": os.path.getmtime(fn)}
+            self.save_uploads()
+            if content["next"]:
+                self.print(f"[yellow]Resuming upload from chunk {content['next']}..")
+
+            return Thread(target = self.stream, args = (fn, content["id"], content["next"], content["chunk"]), daemon = True).start()
+
+        # Finished (or failed, in which case the next try starts over)
+        self.uploading = None
+        self.uploads.pop(fn, None)
+        self.save_uploads()
+        if data.type != "f.done":
+            return self.print(f"[red]{data.content}")
+
+        self.print(f"[green]'{fn.split('/')[-1]}' uploaded successfully!")
+
+    def handle_chunk(self, data: dict) -> None:
+        download = self.downloading
+        if download is None or data["id"] != download["id"] or download.get("failed"):
+            return
+
+        elif data["index"] != download["next"]:
+            download["failed"] = True  # The rest of the stream is ignored until d.end
+            if download["file"] is not None:
+                download["file"].close()  # What made it to disk is kept, the next try resumes from there
+
+            return
+
+        chunk = data["data"]
+        chunk = bytes.fromhex(chunk) if isinstance(chunk, str) else chunk
+        download["next"] += 1
+        if download["file"] is None:
+            return download["data"].extend(chunk)
+
+        download["file"].write(chunk)
+        download["hash"].update(chunk)
+
+    def begin_download(self, content: dict) -> None:
+        requested, self.requested = self.requested, None
+        if requested is None or content["id"] != requested["id"]:
+            return
+
+        elif requested["preview"]:
+            self.downloading = {"id": content["id"], "name": content["name"], "size": content["size"], "next": 0, "file": None, "data": bytearray()}
+            return
+
+        path = os.path.join(self.workdir, content["name"])
+        if os.path.isfile(path):
+            self.awaiting = False
+            return self.print(f"[red]'{content['name']}' already exists locally.")
+
+        # Resuming needs what's on disk to be the start of this very file
+        download = {"id": content["id"], "name": content["name"], "path": path, "size": content["size"], "next": 0, "hash": hashlib.sha256()}
+        if content["offset"]:
+            previous = self.downloads.get(content["id"], {})
+            if [previous.get("path"), previous.get("hash")] != [path, content["hash"]] or os.path.getsize(path + ".part") != content["offset"]:
+                self.awaiting = False
+                self.downloads.pop(content["id"], None)
+                self.save_json(self.downloads_file, self.downloads)
+                return self.print("[red]The unfinished download doesn't match the file anymore, try again to start over.")
+
+            with open(path + ".part", "rb") as file:
+                for block in iter(lambda: file.read(65536), b""):
+                    download["hash"].update(block)
+
+            self.print(f"[yellow]Resuming download from {self.scale(content['offset'])}..")
+
+        self.downloads[content["id"]] = {"path": path, "hash": content["hash"]}
+        self.save_json(self.downloads_file, self.downloads)
+        self.downloading = download | {"file": open(path + ".part", "ab" if content["offset"] else "wb"), "expected": content["hash"]}
+
+    def handle_download(self, data) -> None:
+        content = data.content
+        if data.type == "d.begin":
+            return self.begin_download(content)
+
+        download = self.downloading
+        if download is None or content["id"] != download["id"]:
+            return
+
+        self.downloading, self.awaiting = None, False
+        if content.get("error"):
+            if download["file"] is not None:
+                download["file"].close()  # What arrived is kept, so the next try resumes
+
+            return self.print(f"[red]Download failed: {content['error']} (try again to resume).")
+
+        elif download.get("failed"):
+            return self.print(f"[red]Download failed, chunk {download['next']} never arrived (try again to resume).")
+
+        elif download["file"] is None:
+            text = bytes(download["data"]).decode("utf8", "replace")
+            return self.print(f"[yellow]First {self.scale(len(download['data']))} of '{download['name']}' ({self.scale(download['size'])}):[reset]\n{text}")
+
+        # Chunks were written and hashed as they came in, so the file is checked without reading it again
+        download["file"].close()
+        if download["hash"].hexdigest() != download["expected"]:
+            if os.path.getsize(download["path"] + ".part") < download["size"]:
+                return self.print("[red]Download failed, the file is incomplete (try again to resume).")
+
+            os.remove(download["path"] + ".part")
+            self.downloads.pop(download["id"], None)
+            self.save_json(self.downloads_file, self.downloads)
+            return self.print("[red]Download failed, the file doesn't match its checksum.")
+
+        os.replace(download["path"] + ".part", download["path"])
+        self.downloads.pop(download["id"], None)
+        self.save_json(self.downloads_file, self.downloads)
+        self.print(f"[green]'{download['name']}' downloaded successfully!")
+
     def handle_resp(self, data) -> None:
-        if not self.awaiting:
+        if data.type in ["f.ready", "f.done", "e.file"]:
+            return self.handle_upload(data)
+
+        # Malformed requests get generic errors, they belong to whatever is in flight
+        elif data.type in ["e.missing", "e.invalid"] and self.uploading is not None:
+            return self.handle_upload(data)
+
+        elif not self.awaiting:
             return
 
+        elif data.type in ["e.missing", "e.invalid"]:
+            self.print(f"[red]{data.content}")
+
+        elif data.type in ["d.begin", "d.end"]:
+            return self.handle_download(data)
+
         elif data.type == "d.invalid_id":
             self.print("[red]No file has that ID.")
 
@@ -210,10 +481,7 @@ class FileManager(object):
 
                 self.print(f"[green]'{fn}' downloaded successfully!")
 
-        self.awaiting = False
-
-    def on_recv(self, ctx) -> None:
-        self.packsize = ctx.guild.packet_limit
+        self.awaiting, self.requested = False, None
 
     def on_fire(self, args: list) -> None:
         if not args:
@@ -0,0 +1,48 @@
+# Copyright 2021 iiPython
+
+# Modules
+import os
+import re
+from bisect import bisect_left
+
+# Configuration
+_EMOJI_FILE  = os.path.join(os.path.dirname(__file__), "emojis.txt")  # Same table as the server's
+_EMOJI_LIMIT = 5                                                        # Suggestions shown at once
+
+# Emoji index
+# Shortcodes are kept sorted by their lowercase form, so every shortcode that
+# starts with what's been typed sits in one run found with two bisects; the
+# index is built once, the first time a shortcode is typed
+class EmojiIndex(object):
+    PATTERN = re.compile(u"(?:^|\\s)(:[\\w\\-&.’”“()!#*+?–,/]{2,})$", flags = re.UNICODE)
+
+    def __init__(self, path: str = _EMOJI_FILE) -> None:
+        self.path = path
+        self._keys = None   # Lowercase shortcodes, sorted
+        self._codes = None  # (shortcode, emoji), in the same order
+
+    def load(self) -> None:
+        with open(self.path, "r", encoding = "utf8") as file:
+            codes = sorted((line.split("\t") for line in file.read().splitlines()), key = lambda code: code[0].lower())
+
+        self._keys = [code.lower() for code, _ in codes]
+        self._codes = [tuple(code) for code in codes]
+
+    def complete(self, prefix: str, limit: int = _EMOJI_LIMIT) -> tuple:
+        if self._keys is None:
+            self.load()
+
+        prefix = prefix.lower()
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + "\U0010ffff", start)
+        return self._codes[start:min(end, start + limit)], end - start
+
+    def fragment(self, text: str) -> str:
+        if ":" not in text:
+            return None
+
+        match = self.PATTERN.search(text)
+        return match.group(1) if match is not None else None
+
+# Initialization
+emojis = EmojiIndex()
@@ -5,13 +5,15 @@ import time
 import socket
 from .config import Config
 from .net.parse import parse
+from .net.struct.guild import roster
 from .console import Console
+from .emoji.core import emojis
 from iikp import readchar, keys
 from .plugins import PluginManager
 
 # Initalization
 con, config, plugins = Console(), Config(), PluginManager()
-message_input = ""
+message_input, suggestions = "", []
 
 # Load custom colors
 custom_colors, def_colors = config.get("colors") or {}, {
@@ -24,9 +26,29 @@ for default in def_colors:
         custom_colors[default] = def_colors[default]
 
 def generate_prompt() -> str:
-    return con.print(f"[{custom_colors['prompt']}]> [reset]", print_out = False) +\
+    return con.fragment(f"[{custom_colors['prompt']}]> [reset]") +\
         message_input +\
-        con.print(f"[{custom_colors['prompt']}]_[reset]", print_out = False)
+        con.fragment(f"[{custom_colors['prompt']}]_[reset]") +\
+        generate_suggestions()
+
+def generate_suggestions() -> str:
+    if not suggestions:
+        return ""
+
+    # Only as many as fit on the prompt line (emojis are two columns wide)
+    text, space = "", len(con._ts) - len(message_input) - 4
+    for code, emoji in suggestions:
+        if len(text) + len(code) + 5 > space:
+            break
+
+        text += f"  {code} {emoji}"
+
+    return con.print(f"[lblack]{text}[reset]", print_out = False)
+
+def update_suggestions() -> None:
+    global suggestions
+    fragment = emojis.fragment(message_input)
+    suggestions = emojis.complete(fragment)[0] if fragment is not None else []
 
 # Send loop
 class SendLoop(object):
@@ -35,20 +57,21 @@ class SendLoop(object):
 
     def loop(self) -> None:
         global message_input
-        _old_len = 0
+        _old_len, _old_suggestions = 0, []
         while True:
             try:
                 _len = len(message_input)
                 if _len >= (len(con._ts) - 2):
                     message_input, _len = message_input[:-1], _len - 1
 
-                if _len > _old_len:
+                update_suggestions()
+                if _len > _old_len and not (suggestions or _old_suggestions):
                     print("\r" + generate_prompt(), end = "")
 
                 else:
                     print(f"\r{con._ts}\r{generate_prompt()}\r", end = "")
 
-                _old_len = _len
+                _old_len, _old_suggestions = _len, suggestions
 
                 # Handle keypresses
                 key = readchar()
@@ -58,15 +81,21 @@ class SendLoop(object):
                         message_input = ""
                         continue
 
-                    self.sock.send_json({
-                        "type": "m.msg",
-                        "data": {"content": message_input, "ts": time.time()}
-                    })
+                    packet = {"type": "m.msg", "data": {"content": message_input, "ts": time.time()}}
+                    channel = plugins.plugins["channel"].current
+                    if channel is not None:
+                        packet["data"]["channel"] = channel
+
+                    self.sock.send_json(packet)
                     message_input = ""
 
                 elif key == keys.BACKSPACE and message_input:
                     message_input = message_input[:-1]
 
+                elif key == keys.TAB and suggestions:
+                    fragment = emojis.fragment(message_input)
+                    message_input = message_input[:-len(fragment)] + suggestions[0][0] + " "
+
                 elif key == keys.CTRL_C:
                     break
 
@@ -102,17 +131,23 @@ class ReceiveLoop(object):
             try:
                 messages = self.sock.recv_json()
                 for message in messages:
+                    if message.get("type") == "d.chunk":
+                        plugins.plugins["file"].handle_chunk(message["data"])  # Straight to disk, skips parsing
+                        continue
+
                     data = parse(message)
 
                     # Handle data
-                    ts = data.timestamp
+                    ts, tag = data.timestamp, f"[lblack]#{data.channel} " if data.channel is not None else ""
                     def generate_prefix() -> str:  # noqa
-                        return f"[{custom_colors['time']}]{ts} [{custom_colors['user']}]{plugins.get_name_prefix(data.author)}{data.author.name}[reset] "
+                        return f"[{custom_colors['time']}]{ts} {tag}[{custom_colors['user']}]{plugins.get_name_prefix(data.author)}{data.author.name}[reset] "
 
                     def print_lines(lines: str) -> None:
-                        self.print(f"{generate_prefix()}[lblack]| [reset]{lines[0]}[reset]")
+                        prefix = generate_prefix()
+                        indent = " " * len(con.print(prefix, color = False))
+                        self.print(con.fragment(f"{prefix}[lblack]| [reset]") + f"{lines[0]}[reset]")
                         for line in lines[1:]:
-                            self.print(f"{' ' * len(con.print(generate_prefix(), color = False))}[lblack]| [reset]{line}[reset]")
+                            self.print(con.fragment(f"{indent}[lblack]| [reset]") + f"{line}[reset]")
 
                     if data.type in ["m.msg", "m.bin", "u.join", "u.leave"]:
                         if data.type == "m.bin":
@@ -122,8 +157,17 @@ class ReceiveLoop(object):
 
                         print_lines(plugins.on_recv(data).split("\n"))
 
-                    elif data.type in ["d.content", "d.invalid_id"]:
+                    elif data.type in ["d.begin", "d.end", "d.content", "d.invalid_id", "f.ready", "f.done", "e.file", "e.missing", "e.invalid"]:
                         plugins.plugins["file"].handle_resp(data)
 
+                    elif data.type in ["c.joined", "c.left", "e.channel"]:
+                        plugins.plugins["channel"].handle_resp(data)
+                        if data.type == "c.joined":
+                            messages.extend(packet | {"guild": message["guild"]} for packet in data.content["history"])
+
+                    elif data.type in ["g.roster", "g.roster_add", "g.roster_remove"]:
+                        if not roster.apply(data.type, data.content):
+                            self.sock.send_json({"type": "g.resync"})
+
             except Exception as error:
                 return con.traceback(error)
@@ -0,0 +1,163 @@
+# Copyright 2021 iiPython
+
+# Modules
+import struct
+from collections import deque
+
+# Framing versions
+LEGACY = 1            # JSON terminated by DELIMITER
+LENGTH_PREFIXED = 2   # HEADER (kind, length) followed by the payload
+SUPPORTED = [LEGACY, LENGTH_PREFIXED]
+
+DELIMITER = b"\0x55"
+HEADER = struct.Struct(">BI")
+
+# Frame kinds
+KIND_JSON = 0
+KIND_GROUP = 1   # JSON sealed with the group key: epoch (4 bytes), nonce (12), tag (16), ciphertext
+KIND_CHUNK = 2   # File chunk (sealed with the cipher suite): upload ID (8 bytes), index (4), raw data
+
+CHUNK = struct.Struct(">8sI")
+
+# Helpers
+def negotiate(version: int) -> int:
+    return version if version in SUPPORTED else LEGACY
+
+def pack(payload: bytes, version: int, kind: int = KIND_JSON) -> bytes:
+    if version == LENGTH_PREFIXED:
+        return HEADER.pack(kind, len(payload)) + payload
+
+    return payload + DELIMITER
+
+# Streaming decoder
+# Data is received straight into a preallocated buffer (see writable/written),
+# and frames are handed out as memoryview slices of it; a frame's view is only
+# valid until the next read, so decode it before receiving again
+class FrameDecoder(object):
+    def __init__(self, version: int = LEGACY, limit: int = None, size: int = 4096) -> None:
+        self.version = version
+        self.limit = limit
+
+        # Receive buffer (unread data lives in data[start:end])
+        self.size = size
+        self.data = bytearray(size)
+        self.start, self.end = 0, 0
+        self.peak = size
+
+        # Parsed frames
+        self.frames = deque()
+        self.skip = 0
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def switch(self, version: int) -> None:
+        self.version = version
+        self._parse()  # Parse anything that arrived ahead of the switch
+
+    # Buffer management
+    def readable(self) -> memoryview:
+        return memoryview(self.data)[self.start:self.end]
+
+    def consume(self, size: int = None) -> None:
+        self.start = self.end if size is None else min(self.start + size, self.end)
+        self._rewind()
+
+    def _rewind(self) -> None:
+        if self.start == self.end and not self.frames:
+            self.start, self.end = 0, 0
+            if len(self.data) > self.size:
+                self.data = bytearray(self.size)  # Give back memory from large frames
+
+    def capacity(self, size: int = 0) -> int:
+        size = max(size, len(self.data) // 4)
+        used = self.end - self.start
+        if len(self.data) - self.end >= size or (not self.frames and used + size <= len(self.data)):
+            return len(self.data)
+
+        capacity = len(self.data) * 2
+        while capacity < used + size:
+            capacity *= 2
+
+        return capacity
+
+    def writable(self, size: int = 0) -> memoryview:
+        size = max(size, len(self.data) // 4)
+        if len(self.data) - self.end < size:
+            used, capacity = self.end - self.start, self.capacity(size)
+            if capacity == len(self.data):
+                view = memoryview(self.data)
+                view[:used] = view[self.start:self.end]
+
+            # Pending frames still point into the old buffer, so never move them
+            else:
+                data = bytearray(capacity)
+                data[:used] = memoryview(self.data)[self.start:self.end]
+                self.data, self.peak = data, max(self.peak, capacity)
+
+            self.start, self.end = 0, used
+
+        return memoryview(self.data)[self.end:]
+
+    def written(self, size: int) -> None:
+        self.end += size
+        self._parse()
+
+    def feed(self, data: bytes) -> None:
+        self.writable(len(data))[:len(data)] = data
+        self.written(len(data))
+
+    # Frame parsing
+    def _parse(self) -> None:
+        if self.version != LENGTH_PREFIXED:
+            return self._parse_legacy()
+
+        view = memoryview(self.data)
+        while True:
+            if self.skip:
+                skipped = min(self.skip, self.end - self.start)
+                self.skip, self.start = self.skip - skipped, self.start + skipped
+                if self.skip:
+                    break
+
+            if self.end - self.start < HEADER.size:
+                break
+
+            kind, length = HEADER.unpack_from(self.data, self.start)
+            if self.limit is not None and length > self.limit:
+                self.frames.append(OverflowError(length))
+                self.start, self.skip = self.start + HEADER.size, length
+                continue
+
+            elif self.end - self.start - HEADER.size < length:
+                break
+
+            start = self.start + HEADER.size
+            self.frames.append((kind, view[start:start + length]))
+            self.start = start + length
+
+        self._rewind()
+
+    def _parse_legacy(self) -> None:
+        view = memoryview(self.data)
+        while True:
+            index = self.data.find(DELIMITER, self.start, self.end)
+            if index == -1:
+                break
+
+            if index > self.start:
+                self.frames.append((KIND_JSON, view[self.start:index]))
+
+            self.start = index + len(DELIMITER)
+
+        self._rewind()
+
+    def next(self) -> tuple:
+        if not self.frames:
+            return None
+
+        frame = self.frames.popleft()
+        if isinstance(frame, OverflowError):
+            raise frame
+
+        return frame
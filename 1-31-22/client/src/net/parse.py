@@ -39,6 +39,7 @@ class ParseResult(object):
         # Additional fields
         self.author = User(self.data.get("author"))
         self.content = self.data.get("content")
+        self.channel = self.data.get("channel")
         self.timestamp_raw = datetime.utcfromtimestamp(self.data.get("timestamp")).replace(tzinfo = tz.tzutc()).astimezone(tz.tzlocal())
         self.timestamp = format_timestamp(self.timestamp_raw)
 
@@ -0,0 +1,90 @@
+# Copyright 2021 iiPython
+
+# Modules
+import hmac
+import struct
+import hashlib
+
+from . import framing
+
+try:
+    from Crypto.Cipher import AES, ChaCha20_Poly1305
+
+except ImportError:
+    AES = ChaCha20_Poly1305 = None
+
+# Cipher suites (negotiated during the handshake, only over length prefixed framing)
+# ChaCha20-Poly1305 comes first, its setup is a lot cheaper for small chat frames
+_SUITES = {
+    "chacha20-poly1305": lambda key, nonce: ChaCha20_Poly1305.new(key = key, nonce = nonce),
+    "aes-256-gcm": lambda key, nonce: AES.new(key, AES.MODE_GCM, nonce = nonce)
+}
+SUITES = list(_SUITES) if AES is not None else []
+
+_BUFFER_SIZE = 65536  # Decrypted frames up to this size reuse the connection's buffer
+
+# Session cipher
+# Encrypts whole length prefixed frames: the payload is the frame counter
+# (8 bytes), the ciphertext and the tag, and the header is authenticated too,
+# so a frame can't be cut, resized or replayed; each direction has its own key
+# and the counter is the nonce, so it never repeats for a key
+class SessionCipher(object):
+    COUNTER = struct.Struct(">Q")
+    TAG = 16
+
+    def __init__(self, secret: bytes, server: bool, suite: str) -> None:
+        self.new = _SUITES[suite]
+        keys = [hmac.new(secret, b"plasma " + side, hashlib.sha256).digest() for side in [b"server", b"client"]]
+        self.send_key, self.recv_key = keys if server else keys[::-1]
+
+        # Counters
+        self.sent = 0
+        self.received = -1  # Frames dropped by a send queue leave gaps, so only order is enforced
+
+        # Output buffer for open() (the returned view is valid until the next call)
+        self.buffer = bytearray(4096)
+
+    @classmethod
+    def derive(cls, secret: bytes, server_nonce: bytes, client_nonce: bytes, server: bool, suite: str):
+        return cls(hmac.new(secret, b"plasma-session " + suite.encode() + server_nonce + client_nonce, hashlib.sha256).digest(), server, suite)
+
+    def seal(self, data: bytes, kind: int = framing.KIND_JSON) -> bytearray:
+        length = self.COUNTER.size + len(data) + self.TAG
+        frame = bytearray(framing.HEADER.size + length)
+        framing.HEADER.pack_into(frame, 0, kind, length)
+        self.COUNTER.pack_into(frame, framing.HEADER.size, self.sent)
+        self.sent += 1
+
+        # Encrypt straight into the frame
+        view, start = memoryview(frame), framing.HEADER.size + self.COUNTER.size
+        cipher = self.new(self.send_key, bytes(4) + view[framing.HEADER.size:start])
+        cipher.update(view[:framing.HEADER.size])
+        cipher.encrypt(data, output = view[start:-self.TAG])
+        view[-self.TAG:] = cipher.digest()
+        return frame
+
+    def open(self, kind: int, payload: memoryview) -> memoryview:
+        size = len(payload) - self.COUNTER.size - self.TAG
+        if size < 0:
+            raise ValueError("frame too short")
+
+        counter = self.COUNTER.unpack_from(payload)[0]
+        if counter <= self.received:
+            raise ValueError("frame replayed or out of order")
+
+        # Large frames (files) get their own buffer, so a connection never holds on to one
+        if len(self.buffer) < size <= _BUFFER_SIZE:
+            self.buffer = bytearray(_BUFFER_SIZE)
+
+        output = memoryview(self.buffer if size <= len(self.buffer) else bytearray(size))[:size]
+        cipher = self.new(self.recv_key, bytes(4) + payload[:self.COUNTER.size])
+        cipher.update(framing.HEADER.pack(kind, len(payload)))
+        cipher.decrypt(payload[self.COUNTER.size:-self.TAG], output = output)
+        cipher.verify(payload[-self.TAG:])
+
+        self.received = counter
+        return output
+
+# Helpers
+def available() -> bool:
+    return AES is not None
@@ -1,10 +1,21 @@
 # Copyright 2021 iiPython
 
 # Modules
+import os
 import json
 import socket
+from threading import Lock
 from iipython import Hellman
 
+from . import framing
+from .tickets import TicketStore
+from .session import SessionCipher, SUITES
+
+try:
+    from Crypto.Cipher import AES
+
+except ImportError:
+    AES = None
 from ..config import Config
 from ..console import Console
 
@@ -26,13 +37,61 @@ class Socket(socket.socket):
 
         # Hellman (SSL)
         self.hellman = None
+        self.cipher = None  # Negotiated cipher suite, replaces hellman when set
+        self.send_lock = Lock()
+
+        # Framing
+        self.framing = framing.LEGACY
+        self.decoder = framing.FrameDecoder()
+
+        # Group keys (by epoch, the previous one is kept for frames still in flight)
+        self.group_keys = {}
+
+        # Resumption tickets
+        self.tickets = TicketStore()
 
     def handshake(self) -> None:
         try:
             data = self.recv_json()[0]["data"]
-            self.hellman = Hellman(data["base"], data["modu"])
-            self.send_json({"type": "s.handshake", "data": {"pub": self.hellman.pub_key}}, encrypt = False)
-            self.hellman.generate_shared(data["pub"])
+            version = max(set(data.get("framing", [])) & set(framing.SUPPORTED), default = framing.LEGACY)
+            reply = {"framing": version, "group": AES is not None}
+
+            # Cipher suite (frames are authenticated as a whole, so it needs length prefixed framing)
+            suite = next((suite for suite in data.get("suites", []) if suite in SUITES), None) if version == framing.LENGTH_PREFIXED else None
+            if suite is not None:
+                nonce = os.urandom(16)
+                reply |= {"suite": suite, "nonce": nonce.hex()}
+
+            # Resumption (a valid ticket skips the key exchange, so no key pair is made unless it's turned down)
+            ticket = None
+            if data.get("resume") is True and suite is not None:
+                ticket = self.tickets.get(self.getpeername())
+                reply |= {"resume": True} | ({"ticket": ticket["ticket"]} if ticket is not None else {})
+
+            hellman = Hellman(data["base"], data["modu"]) if ticket is None else None
+            if hellman is not None:
+                reply["pub"] = hellman.pub_key
+
+            self.send_json({"type": "s.handshake", "data": reply}, encrypt = False)
+            self.framing = version
+            self.decoder.switch(version)
+            if ticket is not None:
+                if self.recv_json()[0]["data"]["resumed"]:
+                    self.cipher = SessionCipher.derive(bytes.fromhex(ticket["secret"]), bytes.fromhex(data["nonce"]), nonce, server = False, suite = suite)
+                    if config.debug:
+                        self.console.print("[yellow][SSL]: Resumed the previous session, no key exchange needed.")
+
+                    return
+
+                # Turned down (expired, or sealed with another key), so run the key exchange after all
+                hellman = Hellman(data["base"], data["modu"])
+                self.send_json({"type": "s.handshake", "data": {"pub": hellman.pub_key}}, encrypt = False)
+
+            hellman.generate_shared(data["pub"])
+            if suite is not None:
+                self.cipher = SessionCipher.derive(str(hellman.shared_key).encode("utf8"), bytes.fromhex(data["nonce"]), nonce, server = False, suite = suite)
+
+            self.hellman = hellman
             if config.debug:
                 self.console.print("[yellow][SSL]: DO NOT SHARE THE KEYS BELOW THIS MESSAGE!")
                 self.console.print(f"[yellow][SSL]: pub_key: {self.hellman.pub_key}; mod: {self.hellman.modu}; base: {self.hellman.base}")
@@ -53,44 +112,102 @@ class Socket(socket.socket):
             "type": "u.connect",
             "data": {
                 "id": f"{self.username.lower()}:plasma",
-                "name": self.username
+                "name": self.username,
+                "roster": True
             }
         })
 
     def send_json(self, data: dict, encrypt: bool = True) -> None:
         try:
             data = json.dumps(data)
-            if self.hellman is not None and encrypt:
-                data = self.hellman.encrypt(data)
+            with self.send_lock:
+                if self.cipher is not None and encrypt:
+                    return self.sendall(self.cipher.seal(data.encode("utf8")))  # Already a whole frame
+
+                elif self.hellman is not None and encrypt:
+                    data = self.hellman.encrypt(data)
+
+                else:
+                    data = data.encode("utf8")
 
-            else:
-                data = data.encode("utf8")
+                if self.framing == framing.LENGTH_PREFIXED:
+                    data = framing.pack(data, self.framing)
 
-            self.sendall(data)
+                self.sendall(data)
+
+        except OSError:
+            return self.console.exit(1, FAILED_MSG)
+
+    def send_chunk(self, upload: str, index: int, data: bytes) -> None:
+        if self.cipher is None:
+            return self.send_json({"type": "f.chunk", "data": {"id": upload, "index": index, "data": data.hex()}})
+
+        # Raw binary frame (only the cipher suite can seal those)
+        try:
+            with self.send_lock:
+                self.sendall(self.cipher.seal(framing.CHUNK.pack(upload.encode("ascii"), index) + data, framing.KIND_CHUNK))
 
         except OSError:
             return self.console.exit(1, FAILED_MSG)
 
     def recv_json(self) -> list:
-        data = b""
-        while True:
+        messages = []
+        while not messages:
             try:
-                data += self.recv(2048)
-                try:
-                    if self.hellman is not None:
-                        data = [json.loads(self.hellman.decrypt(_)) for _ in data.split(b"\0x55") if _.strip()]
-                        break
+                size = self.recv_into(self.decoder.writable(2048))
+                if not size:
+                    raise OSError
 
-                    data = [json.loads(_) for _ in data.decode("utf8").split("\0x55") if _.strip()]
-                    break
+            except OSError:
+                self.console.exit(1, FAILED_MSG)
 
-                except (json.JSONDecodeError, UnicodeDecodeError):
-                    pass
+            self.decoder.written(size)
+            frame = self.decoder.next()
+            while frame is not None:
+                if frame[0] == framing.KIND_GROUP:
+                    message = self.open_group(frame[1])
 
-            except OSError:
-                self.console.exit(1, self._FAILED_MSG)
+                elif self.cipher is not None:
+                    message = self.load(self.cipher.open(frame[0], frame[1]), frame[0])
+
+                elif self.hellman is not None:
+                    message = json.loads(self.hellman.decrypt(bytes(frame[1])))
+
+                else:
+                    message = self.load(frame[1], frame[0])
+
+                if message is not None and message.get("type") == "s.key":
+                    self.add_group_key(message["data"]["content"])
+
+                elif message is not None and message.get("type") == "s.ticket":
+                    self.tickets.save(self.getpeername(), message["data"]["content"])
+
+                elif message is not None:
+                    messages.append(message)
+
+                frame = self.decoder.next()
+
+        return messages
+
+    def load(self, data: memoryview, kind: int) -> dict:
+        if kind == framing.KIND_CHUNK:
+            download, index = framing.CHUNK.unpack_from(data)
+            return {"type": "d.chunk", "data": {"id": download.decode("ascii"), "index": index, "data": bytes(data[framing.CHUNK.size:])}}
+
+        return json.loads(str(data, "utf8"))
+
+    def add_group_key(self, data: dict) -> None:
+        self.group_keys[data["epoch"]] = bytes.fromhex(data["key"])
+        for epoch in [epoch for epoch in self.group_keys if epoch < data["epoch"] - 1]:
+            del self.group_keys[epoch]
+
+    def open_group(self, data: memoryview) -> dict:
+        key = self.group_keys.get(int.from_bytes(data[:4], "big"))
+        if key is None:
+            return None  # Sealed with a key we never got (or already dropped)
 
-        return data
+        nonce, tag, ciphertext = bytes(data[4:16]), bytes(data[16:32]), bytes(data[32:])
+        return json.loads(AES.new(key, AES.MODE_GCM, nonce = nonce).decrypt_and_verify(ciphertext, tag))
 
     # Handshaking Error
     class HandshakeError(Exception):
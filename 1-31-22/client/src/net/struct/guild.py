@@ -3,9 +3,46 @@
 # Modules
 from .user import User
 
+# Roster class (kept up to date by g.roster* packets)
+class Roster(object):
+    def __init__(self) -> None:
+        self.version = None
+        self.users = {}
+        self.resyncing = False
+
+    def apply(self, type: str, content: dict) -> bool:
+        if type == "g.roster":
+            self.version, self.resyncing = content["version"], False
+            self.users = {user["uid"]: User(user) for user in content["users"]}
+            return True
+
+        # Deltas older than our snapshot are already applied
+        version = content["version"]
+        if self.version is None or version <= self.version:
+            return True
+
+        elif version != self.version + 1:
+            if self.resyncing:
+                return True  # Already waiting on a fresh snapshot
+
+            self.resyncing = True
+            return False
+
+        user = content["user"]
+        if type == "g.roster_add":
+            self.users[user["uid"]] = User(user)
+
+        else:
+            self.users.pop(user["uid"], None)
+
+        self.version = version
+        return True
+
+roster = Roster()
+
 # Guild class
 class Guild(object):
     def __init__(self, data: dict) -> None:
         self.name = data["name"]
-        self.users = [User(user) for user in data["users"]]
+        self.users = [User(user) for user in data["users"]] if "users" in data else list(roster.users.values())
         self.packet_limit = data["packet_limit"] or 1048576
@@ -0,0 +1,45 @@
+# Copyright 2021 iiPython
+
+# Modules
+import os
+import json
+import time
+
+# Ticket store class
+# Resumption tickets are kept per server next to config.json, so connecting
+# again skips the key exchange until the server's ticket expires
+class TicketStore(object):
+    def __init__(self) -> None:
+        self.path = os.path.join(
+            os.path.dirname(os.path.dirname(__file__)),
+            "../tickets.json"
+        )
+        self.tickets = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r") as tickets:
+                    self.tickets = json.loads(tickets.read())
+
+            except Exception:
+                pass
+
+    def get(self, addr: tuple) -> dict:
+        ticket = self.tickets.get(f"{addr[0]}:{addr[1]}")
+        if ticket is None or ticket["expires"] < time.time():
+            return None
+
+        return ticket
+
+    def save(self, addr: tuple, data: dict) -> None:
+        self.tickets = {key: ticket for key, ticket in self.tickets.items() if ticket["expires"] >= time.time()}
+        self.tickets[f"{addr[0]}:{addr[1]}"] = {
+            "ticket": data["ticket"],
+            "secret": data["secret"],
+            "expires": time.time() + data["lifetime"]
+        }
+        try:
+            with open(self.path, "w") as tickets:
+                tickets.write(json.dumps(self.tickets, indent = 4))
+
+        except OSError:
+            pass  # Next connection just runs the full handshake
@@ -13,7 +13,7 @@ from .net.struct.user import User
 
 # Built-in plugins
 from .defaults.def_plugins import (
-    FileManager, PluginManager_
+    FileManager, ChannelManager, PluginManager_
 )
 
 # Exceptions
@@ -29,7 +29,7 @@ class PluginManager(object):
         self.plugin_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "plugins")
 
     def def_plugins(self) -> None:
-        self.plugins = {"plugins": PluginManager_(self), "file": FileManager(self)}
+        self.plugins = {"plugins": PluginManager_(self), "file": FileManager(self), "channel": ChannelManager(self)}
 
     def on_recv(self, ctx) -> str:
         self.last = ctx
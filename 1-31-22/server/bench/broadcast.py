@@ -0,0 +1,88 @@
+# Copyright 2021 iiPython
+# Broadcast benchmark: legacy per-recipient encoding vs. the serialize-once path
+# Usage: python bench/broadcast.py
+
+# Modules
+import os
+import sys
+import json
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from core.emoji.core import em  # noqa: E402
+from core.socket import SocketWrapper, Frame  # noqa: E402
+
+try:
+    from iipython import Hellman
+
+except ImportError:
+    Hellman = None
+
+# Fake socket
+class NullSocket(object):
+    def sendall(self, data: bytes) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+# Helpers
+def make_recipients(count: int, encrypted: bool) -> list:
+    recipients = []
+    for _ in range(count):
+        wrap = SocketWrapper(NullSocket())
+        if encrypted:
+            wrap.hellman = Hellman(random.randint(1000, 9999), random.randint(10 ** 15, 15 ** 15))
+            wrap.hellman.generate_shared(wrap.hellman.pub_key)
+
+        recipients.append(wrap)
+
+    return recipients
+
+def make_packet(users: int) -> dict:
+    return {
+        "type": "m.msg",
+        "data": {
+            "author": {"uid": "a" * 128, "name": "benchmark"},
+            "content": "hey everyone :wave: how's it going? :thumbs_up:",
+            "timestamp": time.time()
+        },
+        "guild": {
+            "name": "Benchmark",
+            "users": [{"uid": str(i) * 8, "name": f"user{i}"} for i in range(users)],
+            "packet_limit": None
+        }
+    }
+
+def legacy(recipients: list, packet: dict) -> None:
+    data = json.loads(em(json.dumps(packet)))
+    for wrap in recipients:
+        if wrap.hellman is not None:
+            wrap.sock.sendall(wrap.hellman.encrypt(json.dumps(data)) + b"\0x55")
+
+        else:
+            wrap.sock.sendall(json.dumps(data).encode("utf8") + b"\0x55")
+
+def serialize_once(recipients: list, packet: dict) -> None:
+    frame = Frame(em(json.dumps(packet)))
+    for wrap in recipients:
+        wrap.sock.sendall(wrap._seal(frame))
+
+def measure(func, recipients: list, packet: dict, seconds: float = 1) -> float:
+    count, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        func(recipients, packet)
+        count += 1
+
+    return count / (time.perf_counter() - start)
+
+# Main
+if __name__ == "__main__":
+    modes = [False] + ([True] if Hellman is not None else [])
+    for encrypted in modes:
+        print(f"{'encrypted' if encrypted else 'plaintext'} recipients:")
+        for count in [10, 100, 1000]:
+            recipients, packet = make_recipients(count, encrypted), make_packet(count)
+            old, new = measure(legacy, recipients, packet), measure(serialize_once, recipients, packet)
+            print(f"  N = {count:<5} legacy: {old:>10.1f} msg/s  serialize-once: {new:>10.1f} msg/s  ({new / old:.1f}x)")
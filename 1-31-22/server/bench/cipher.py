@@ -0,0 +1,64 @@
+# Copyright 2021 iiPython
+# Cipher benchmark: MB/s and per-message latency, Hellman vs. the negotiated cipher suite
+# Usage: python bench/cipher.py [seconds per case]
+
+# Modules
+import os
+import sys
+import json
+import time
+import random
+from iipython import Hellman
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from core import framing  # noqa: E402
+from core.session import SessionCipher, SUITES, available  # noqa: E402
+
+# Helpers
+def make_hellman() -> Hellman:
+    hellman = Hellman(random.randint(1000, 9999), random.randint(10 ** 15, 15 ** 15))
+    hellman.generate_shared(hellman.pub_key)
+    return hellman
+
+def make_packet(size: int) -> str:
+    packet = {"type": "m.msg", "data": {"author": {"uid": "a" * 128, "name": "benchmark"}, "content": "", "timestamp": time.time()}}
+    packet["data"]["content"] = "x" * max(size - len(json.dumps(packet)), 0)
+    return json.dumps(packet)
+
+def hellman_path(hellman: Hellman, decoder: framing.FrameDecoder, text: str) -> dict:
+    decoder.feed(framing.pack(hellman.encrypt(text), framing.LENGTH_PREFIXED))
+    return json.loads(hellman.decrypt(bytes(decoder.next()[1])))
+
+def suite_path(sender: SessionCipher, receiver: SessionCipher, decoder: framing.FrameDecoder, text: str) -> dict:
+    decoder.feed(sender.seal(text.encode("utf8")))
+    return json.loads(str(receiver.open(*decoder.next()), "utf8"))
+
+def measure(func, seconds: float) -> tuple:
+    count, start = 0, time.perf_counter()
+    while not count or time.perf_counter() - start < seconds:
+        func()
+        count += 1
+
+    return count, (time.perf_counter() - start) / count
+
+# Main
+if __name__ == "__main__":
+    if not available():
+        sys.exit("pycryptodome is needed for the cipher suite.")
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    hellman = make_hellman()
+    secret = os.urandom(32)
+    suites = {suite: (SessionCipher(secret, True, suite), SessionCipher(secret, False, suite)) for suite in SUITES}
+
+    print("Encrypt + frame + decrypt + parse, per message:")
+    for name, size in [("chat (100 B)", 100), ("file (10 MB)", 10 * 1048576)]:
+        text, decoder = make_packet(size), framing.FrameDecoder(framing.LENGTH_PREFIXED, size = 65536)
+        print(f"  {name}:")
+        cases = [("hellman", lambda: hellman_path(hellman, decoder, text))]
+        for suite, (sender, receiver) in suites.items():
+            cases.append((suite, lambda sender = sender, receiver = receiver: suite_path(sender, receiver, decoder, text)))
+
+        for label, func in cases:
+            count, latency = measure(func, seconds)
+            print(f"    {label:<18} {latency * 1e6:>14.1f}us {len(text) / latency / 1048576:>10.1f} MB/s  ({count} runs)")
@@ -0,0 +1,71 @@
+# Copyright 2021 iiPython
+# Console benchmark: lines/sec for the old replace-per-tag renderer vs. the single pass renderer
+# Usage: python bench/console.py [lines]
+
+# Modules
+import os
+import re
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from console import Console  # noqa: E402
+
+# Old implementation (two str.replace calls per known tag, findall + replace to strip)
+def legacy_render(con: Console, text: str) -> str:
+    text += ("[reset]" if not text.endswith("[reset]") else "")
+    for tag in con._color_map:
+        text = text.replace(f"[{tag}]", con._color_map[tag]).replace(f"[/{tag}]", con._color_map["reset"])
+
+    return text
+
+def legacy_strip(text: str) -> str:
+    for tag in re.findall(r"\[\/*[a-zA-Z]{1,}\]", text):
+        text = text.replace(tag, "")
+
+    return text
+
+# Corpus (what the server prints for chat: a prefix per line, which repeats, then the content)
+WORDS = "hey everyone how is it going did you see the new build lol yeah works for me brb back ok sure thanks".split()
+NAMES = [f"user{i}" for i in range(50)]
+
+def make_line(minute: int) -> tuple:
+    prefix = f"[cyan]{minute // 60 % 24:02}:{minute % 60:02} [lgreen]{random.choice(NAMES)}[reset] "
+    return prefix, " ".join(random.choices(WORDS, k = random.randint(3, 20)))
+
+# How each side prints a chat line
+def legacy_line(con: Console, line: tuple) -> str:
+    return legacy_render(con, f"{line[0]}[lblack]| [reset]{line[1]}[reset]")
+
+def new_line(con: Console, line: tuple) -> str:
+    return con.print(con.fragment(f"{line[0]}[lblack]| [reset]") + f"{line[1]}[reset]", print_out = False)
+
+def measure(func, lines: list) -> float:
+    start = time.perf_counter()
+    for line in lines:
+        func(line)
+
+    return len(lines) / (time.perf_counter() - start)
+
+# Main
+if __name__ == "__main__":
+    random.seed(2021)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lines = [make_line(index // 1000) for index in range(count)]  # 1000 lines a minute
+    prefixes = [prefix for prefix, _ in lines]
+    con = Console()
+
+    # Both must produce the same output
+    for line in lines[:1000] + [("[red]a[/red] [nope] [/bold] [[red]]", "[bglblue]x")]:
+        assert legacy_line(con, line) == new_line(con, line)
+        assert legacy_strip(line[0] + line[1]) == con.print(line[0] + line[1], color = False)
+
+    print(f"{count} lines:")
+    for name, corpus, old, new in [
+        ("render lines", lines, lambda line: legacy_line(con, line), lambda line: new_line(con, line)),
+        ("strip prefixes", prefixes, legacy_strip, lambda prefix: con.print(prefix, color = False)),
+        ("render prefixes", prefixes, lambda prefix: legacy_render(con, prefix), con.fragment)
+    ]:
+        old, new = measure(old, corpus), measure(new, corpus)
+        print(f"  {name + ':':<17}{old:>10.0f} lines/s  ->  {new:>10.0f} lines/s  ({new / old:.1f}x)")
@@ -0,0 +1,79 @@
+# Copyright 2021 iiPython
+# Emoji benchmark: the old per-call em() over the whole packet vs. the precompiled engine over the content
+# Usage: python bench/emoji.py [messages]
+
+# Modules
+import os
+import re
+import sys
+import json
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from core.emoji.core import em, engine  # noqa: E402
+
+# Old implementation (compiled and run over the dumped packet on every broadcast)
+def legacy_em(string: str) -> str:
+    pattern = re.compile(u'(%s[\\w\\-&.’”“()!#*+?–,/]+%s)' % (":", ":"), flags = re.UNICODE)
+    def replace(match):  # noqa
+        mg = match.group(1).replace(":", ":").replace(":", ":")
+        emj = engine.table.get(mg, mg)
+        return emj
+
+    return pattern.sub(replace, string)
+
+# Corpus (mostly plain chat, some shortcodes, some colons that aren't shortcodes)
+WORDS = "hey everyone how is it going did you see the new build lol yeah works for me brb back ok sure thanks".split()
+CODES = [":thumbs_up:", ":wave:", ":joy:", ":fire:", ":eyes:", ":tada:", ":not_an_emoji:"]
+COLONS = ["meet at 10:30", "see https://example.com/a:b", "note: check the logs", "ratio 16:9"]
+
+def make_message() -> str:
+    words = random.choices(WORDS, k = random.randint(3, 20))
+    roll = random.random()
+    if roll < .2:
+        for _ in range(random.randint(1, 3)):
+            words.insert(random.randint(0, len(words)), random.choice(CODES))
+
+    elif roll < .3:
+        words.insert(random.randint(0, len(words)), random.choice(COLONS))
+
+    return " ".join(words)
+
+def make_packet(content: str) -> dict:
+    return {
+        "type": "m.msg",
+        "data": {"author": {"uid": "a" * 128, "name": "benchmark"}, "content": content, "timestamp": time.time()},
+        "guild": {"name": "Benchmark", "users": [{"uid": str(i) * 8, "name": f"user{i}"} for i in range(20)], "packet_limit": None}
+    }
+
+def old_path(packet: dict) -> str:
+    return legacy_em(json.dumps(packet))
+
+def new_path(packet: dict) -> str:
+    return json.dumps(packet | {"data": packet["data"] | {"content": em(packet["data"]["content"])}})
+
+def measure(func, packets: list) -> float:
+    start = time.perf_counter()
+    for packet in packets:
+        func(packet)
+
+    return len(packets) / (time.perf_counter() - start)
+
+# Main
+if __name__ == "__main__":
+    random.seed(2021)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    packets = [make_packet(make_message()) for _ in range(count)]
+
+    # Both must produce the same content
+    for packet in packets[:1000]:
+        assert json.loads(old_path(packet))["data"]["content"] == json.loads(new_path(packet))["data"]["content"]
+
+    print(f"{count} messages (packet dump included in both):")
+    old, new = measure(old_path, packets), measure(new_path, packets)
+    print(f"  em() per packet: {old:>10.0f} msg/s  engine per content: {new:>10.0f} msg/s  ({new / old:.1f}x)")
+
+    contents = [packet["data"]["content"] for packet in packets]
+    old, new = measure(legacy_em, contents), measure(em, contents)
+    print(f"  content only:    {old:>10.0f} msg/s  engine:             {new:>10.0f} msg/s  ({new / old:.1f}x)")
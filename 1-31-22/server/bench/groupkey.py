@@ -0,0 +1,76 @@
+# Copyright 2021 iiPython
+# Group key benchmark: CPU time per broadcast, per-client encryption vs. the group key
+# Usage: python bench/groupkey.py [recipients]
+
+# Modules
+import os
+import sys
+import time
+import random
+from iipython import Hellman
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from core import framing  # noqa: E402
+from core.groupkey import GroupKey, available  # noqa: E402
+from core.socket import SocketWrapper, Frame  # noqa: E402
+
+# Fake socket
+class NullSocket(object):
+    def sendall(self, data: bytes) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+# Helpers
+def make_recipients(count: int) -> list:
+    recipients = []
+    for _ in range(count):
+        wrap = SocketWrapper(NullSocket())
+        wrap.hellman = Hellman(random.randint(1000, 9999), random.randint(10 ** 15, 15 ** 15))
+        wrap.hellman.generate_shared(wrap.hellman.pub_key)
+        wrap.framing, wrap.group = framing.LENGTH_PREFIXED, True
+        recipients.append(wrap)
+
+    return recipients
+
+def make_packet() -> dict:
+    return {
+        "type": "m.msg",
+        "data": {
+            "author": {"uid": "a" * 128, "name": "benchmark"},
+            "content": "hey everyone 👋 how's it going? 👍",
+            "timestamp": time.time()
+        },
+        "guild": {"name": "Benchmark", "packet_limit": None}
+    }
+
+def measure(recipients: list, key: GroupKey, messages: int = 20) -> float:
+    start = time.process_time()
+    for _ in range(messages):
+        frame = Frame(make_packet())
+        for wrap in recipients:
+            wrap.sock.sendall(wrap._seal(frame, key))
+
+    return (time.process_time() - start) / messages
+
+# Main
+if __name__ == "__main__":
+    if not available():
+        sys.exit("pycryptodome is needed for group keys.")
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    recipients = make_recipients(count)
+
+    old, new = measure(recipients, None), measure(recipients, GroupKey())
+    print(f"CPU time per broadcast to {count} recipients:")
+    print(f"  per-client: {old * 1000:>10.3f}ms")
+    print(f"  group key:  {new * 1000:>10.3f}ms  ({old / new:.1f}x less, {(old - new) * 1000:.3f}ms saved per message)")
+
+    # A member leaving costs one per-client encryption per member (the new key)
+    key = GroupKey()
+    start = time.process_time()
+    for wrap in recipients:
+        wrap.sock.sendall(wrap._seal(Frame({"type": "s.key", "data": {"content": key.rotate().to_dict()}})))
+
+    print(f"  rotation:   {(time.process_time() - start) * 1000:>10.3f}ms per leave")
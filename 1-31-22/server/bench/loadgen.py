@@ -0,0 +1,116 @@
+# Copyright 2021 iiPython
+# Load generator: many connected clients, a few of them chatting as fast as they can
+# Usage: python bench/loadgen.py [--clients 200] [--senders 20] [--seconds 10] [--procs N]
+# Run it against a server with "workers" set to 1, 2, 4.. to see how throughput scales
+
+# Modules
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import selectors
+import multiprocessing
+from iipython import Hellman
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from core import framing  # noqa: E402
+
+# Connection
+class Connection(object):
+    def __init__(self, addr: tuple, name: str) -> None:
+        self.sock = socket.create_connection(addr)
+        self.decoder = framing.FrameDecoder(framing.LENGTH_PREFIXED, size = 65536)
+
+        # Handshake (always sent with legacy framing)
+        data = b""
+        while framing.DELIMITER not in data:
+            data += self.sock.recv(4096)
+
+        packet = json.loads(data.split(framing.DELIMITER)[0])["data"]
+        self.hellman = Hellman(packet["base"], packet["modu"])
+        self.sock.sendall(json.dumps({"type": "s.handshake", "data": {"pub": self.hellman.pub_key, "framing": framing.LENGTH_PREFIXED}}).encode("utf8"))
+        self.hellman.generate_shared(packet["pub"])
+
+        # Join and wait for the welcome message
+        self.send({"type": "u.connect", "data": {"name": name, "roster": True}})
+        while not self.read():
+            pass
+
+    def send(self, data: dict) -> None:
+        self.sock.sendall(framing.pack(self.hellman.encrypt(json.dumps(data)), framing.LENGTH_PREFIXED))
+
+    def read(self) -> int:
+        size = self.sock.recv_into(self.decoder.writable(65536))
+        if not size:
+            raise ConnectionError
+
+        # Frames are only counted, decrypting them would make the generator the bottleneck
+        self.decoder.written(size)
+        frames = len(self.decoder.frames)
+        self.decoder.frames.clear()
+        self.decoder.consume(0)
+        return frames
+
+# Worker process
+def run(index: int, args: argparse.Namespace, barrier, results) -> None:
+    addr = (args.host, args.port)
+    clients = range(index, args.clients, args.procs)
+    connections = [Connection(addr, f"load{client}") for client in clients]
+    senders = [conn for client, conn in zip(clients, connections) if client < args.senders]
+
+    selector = selectors.DefaultSelector()
+    for conn in connections:
+        selector.register(conn.sock, selectors.EVENT_READ, conn)
+
+    def drain(timeout: float) -> int:
+        received = 0
+        for key, _ in selector.select(timeout):
+            received += key.data.read()  # Readable, so this never blocks
+
+        return received
+
+    # Let the join messages settle before measuring
+    barrier.wait()
+    end = time.perf_counter() + 1
+    while time.perf_counter() < end:
+        drain(0.05)
+
+    barrier.wait()
+    sent, received = 0, 0
+    end = time.perf_counter() + args.seconds
+    while time.perf_counter() < end:
+        for conn in senders:
+            conn.send({"type": "m.msg", "data": {"content": f"load test :fire: {sent}"}})
+            sent += 1
+
+        received += drain(0 if senders else 0.05)
+
+    results.put((sent, received))
+
+# Main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Plasma server load generator")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 2075)
+    parser.add_argument("--clients", type = int, default = 200)
+    parser.add_argument("--senders", type = int, default = 20)
+    parser.add_argument("--seconds", type = float, default = 10)
+    parser.add_argument("--procs", type = int, default = os.cpu_count())
+    args = parser.parse_args()
+    args.procs = max(min(args.procs, args.clients), 1)
+
+    barrier, results = multiprocessing.Barrier(args.procs), multiprocessing.Queue()
+    processes = [multiprocessing.Process(target = run, args = (index, args, barrier, results)) for index in range(args.procs)]
+    for process in processes:
+        process.start()
+
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    sent, received = sum(total[0] for total in totals), sum(total[1] for total in totals)
+    print(f"{args.clients} clients, {args.senders} senders, {args.seconds}s:")
+    print(f"  sent:      {sent / args.seconds:>12.1f} msg/s")
+    print(f"  delivered: {received / args.seconds:>12.1f} msg/s")
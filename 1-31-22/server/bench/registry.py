@@ -0,0 +1,78 @@
+# Copyright 2021 iiPython
+# Client registry benchmark: join/leave churn with 50k connected clients
+# Usage: python bench/registry.py
+
+# Modules
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "struct"))
+from registry import ClientRegistry  # noqa: E402
+
+# Fake client
+class FakeClient(object):
+    def __init__(self, name: str) -> None:
+        self.attr = {"uid": name, "name": name}
+
+# Churn implementations
+def legacy_join(clients: list, client: FakeClient) -> bool:
+    name = client.attr["name"]
+    if name.lower() in [u.attr["name"].lower() for u in clients if u.attr.get("name")]:
+        return False
+
+    clients.append(client)
+    return True
+
+def legacy_leave(clients: list, client: FakeClient) -> None:
+    clients.remove(client)
+
+def registry_join(clients: ClientRegistry, client: FakeClient) -> bool:
+    clients.add(client)
+    if not clients.claim(client, client.attr["name"], client.attr["uid"]):
+        clients.remove(client)
+        return False
+
+    return True
+
+def registry_leave(clients: ClientRegistry, client: FakeClient) -> None:
+    clients.remove(client)
+
+def measure(clients, join, leave, population: list, cycles: int) -> float:
+    if isinstance(clients, list):
+        clients.extend(population)  # Joining one by one is quadratic here
+
+    else:
+        for client in population:
+            join(clients, client)
+
+    # Churn the oldest clients out and new ones in
+    start = time.perf_counter()
+    for index in range(cycles):
+        leave(clients, population[index])
+        join(clients, FakeClient(f"churn{index}"))
+
+    return cycles / (time.perf_counter() - start)
+
+# Main
+if __name__ == "__main__":
+    size = 50000
+    population = [FakeClient(f"user{i}") for i in range(size)]
+
+    old = measure([], legacy_join, legacy_leave, population, 50)
+    new = measure(ClientRegistry(), registry_join, registry_leave, population, 50000)
+    print(f"{size} clients, join + leave cycles/sec:")
+    print(f"  list:     {old:>12.1f}")
+    print(f"  registry: {new:>12.1f}  ({new / old:.0f}x)")
+
+    # Snapshot cost after a change (paid once per broadcast, not per client)
+    clients = ClientRegistry()
+    for client in population:
+        registry_join(clients, client)
+
+    start = time.perf_counter()
+    for index in range(100):
+        clients.remove(population[index])
+        clients.snapshot()
+
+    print(f"  snapshot rebuild after churn: {(time.perf_counter() - start) / 100 * 1000:.2f}ms")
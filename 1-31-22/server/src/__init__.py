@@ -1,6 +1,6 @@
 from .base import server
 from .core.config import config
-from .core.socket import Socket, SocketWrapper
+from .core.socket import Socket, SocketWrapper, AsyncSocketWrapper, Frame
 
 __author__ = "iiPython"
 __license__ = "MIT"
@@ -2,15 +2,36 @@
 
 # Modules
 import os
-import json
-from threading import Thread
+import time
+import signal
+import socket
+import asyncio
+import tempfile
+import multiprocessing
+from threading import Thread, Timer, Lock
 from datetime import datetime
 
 from .console import Console
+from .core import groupkey
 from .core.emoji.core import em
 from .core.config import config
+from .core.memory import memory, _MEMORY_REPORT
+from .core.iopool import iopool
+from .core.bus import Bus, BusHub
+from .core.groupkey import _GROUP_DELAY
+from .core.handshake import keys, handshakes, _HANDSHAKE_REPORT
+from .core.queue import totals, _QUEUE_REPORT
 from .struct.client import Client
-from .core.socket import Socket, SocketWrapper
+from .struct.registry import ClientRegistry
+from .struct.files import FileStore
+from .struct.uploads import UploadRegistry
+from .struct.channels import ChannelRegistry
+from .core.socket import Socket, SocketWrapper, AsyncSocketWrapper, Frame
+
+# Configuration (console.py stays importable on its own, for bench/console.py)
+_CONSOLE_CONFIG = config.get("console") or {}
+_CONSOLE_QUIET  = _CONSOLE_CONFIG.get("quiet", False)  # Don't print chat (headless servers)
+_CONSOLE_QUEUE  = _CONSOLE_CONFIG.get("queue", 1024)   # Lines waiting to be written before new ones are dropped
 
 # Server class
 class Server(object):
@@ -18,70 +39,314 @@ class Server(object):
         self.sock = Socket()
         self.wrap = SocketWrapper(self.sock)
 
-        self.clients = []
-        self.console = Console()
+        self.clients = ClientRegistry()
+        self.channels = ChannelRegistry()
+        self.files = FileStore()
+        self.uploads = UploadRegistry(self.files)
+        self.console = Console(_CONSOLE_QUIET, _CONSOLE_QUEUE)
+
+        # Worker bus (only set inside worker processes)
+        self.bus = None
+
+        # Group key (broadcasts are encrypted once for every member)
+        self.group = groupkey.GroupKey() if groupkey.available() else None
+        self.rotation = None  # Pending rotation, leaves close together share it (broadcasts are sealed per client until it runs)
+        self.loop = None      # Event loop (async mode)
+        self._rotation_lock = Lock()
+
+    def to_dict(self, users: bool = True) -> dict:
+        if not users:
+            return {"name": config.get("name")}
+
+        return {"name": config.get("name"), "users": self.roster()["users"]}
+
+    def roster(self) -> dict:
+        with self.clients.lock:
+            if self.bus is not None:
+                return self.bus.roster()
+
+            return {"version": self.clients.version, "users": [client.to_dict() for client in self.clients.authed()]}
+
+    def rotate_group(self) -> None:
+        with self._rotation_lock:
+            if self.rotation is not None:
+                return
+
+            if self.loop is not None:
+                self.rotation = self.loop.call_later(_GROUP_DELAY, self._rotate_group)
 
-    def to_dict(self) -> dict:
-        return {
-            "name": config.get("name"),
-            "users": [client.to_dict() for client in self.clients if client.authed]
-        }
+            else:
+                self.rotation = Timer(_GROUP_DELAY, self._rotate_group)
+                self.rotation.daemon = True
+                self.rotation.start()
+
+    def _rotate_group(self) -> None:
+        failed = []
+        with self.clients.lock:
+            key = self.group.rotate()
+            for client in self.clients.authed():
+                if client.sock.group:
+                    try:
+                        client.sock.send_json(client.pack_json(type = "s.key", content = key.to_dict()) | {"guild": client.guild()})
+
+                    except OSError:
+                        failed.append(client)
+
+            # Members keep the previous key, so frames sealed before the switch still open
+            self.group = key
+            with self._rotation_lock:
+                self.rotation = None  # Every member has the new key, broadcasts can use it again
+
+        # Shut down only after the switch, their leaves start the next rotation
+        for client in failed:
+            client.shutdown()
+
+    def broadcast_roster(self, type: str, client: Client) -> None:
+        if self.bus is not None:
+            return self.bus.announce(type[2:], client.to_dict())  # The hub sends it back to every worker
+
+        self.broadcast(client.pack_json(
+            type = type,
+            content = {"version": self.clients.version, "user": client.to_dict()}
+        ), roster = True)
 
     def close(self) -> None:
 
         # Shutdown clients
-        for client in self.clients:
+        for client in self.clients.snapshot():
             client.shutdown()
 
         # Exit server
-        self.console.print("\r[red]^C | Server shutdown successfully.")
+        if self.bus is None:
+            self.console.print("\r[red]^C | Server shutdown successfully.")
+
+        self.console.flush()
         os._exit(0)  # Kills off our threads
 
     def start(self, addr: tuple, name: str) -> None:
         self.name = name
         self.addr = addr
 
+        # Worker processes
+        workers = config.get("workers") or 1
+        if workers > 1:
+            if hasattr(socket, "SO_REUSEPORT"):
+                return self.start_workers(workers)
+
+            self.console.print("[yellow]This platform has no SO_REUSEPORT, running a single process instead..")
+
         # Connect socket
-        self.sock.bind(("0.0.0.0", 2075))
-        self.sock.listen(5)
+        self.listen()
 
         # Start text
         self.console.clear()
         self.console.print("[blue]Server running on [yellow]0.0.0.0:2075[blue]..")
+        self.serve()
 
-        # Client handler
+    def listen(self) -> None:
+        self.sock.bind(("0.0.0.0", 2075))
+        self.sock.listen(5)
+        memory.start()
+        keys.start()
+        iopool.start()
+        self.files.start()
+        self.console.start()
+
+        # Handshake metrics
+        if _HANDSHAKE_REPORT:
+            Thread(target = self.report_handshakes, daemon = True).start()
+
+        # Send queue metrics
+        if _QUEUE_REPORT:
+            Thread(target = self.report_queues, daemon = True).start()
+
+        # Receive buffer metrics
+        if _MEMORY_REPORT:
+            Thread(target = self.report_memory, daemon = True).start()
+
+    def report_handshakes(self) -> None:
+        while True:
+            time.sleep(_HANDSHAKE_REPORT)
+            stats = handshakes.stats()
+            self.console.print(
+                f"[lblack]Handshakes: [yellow]{stats['rate']:.1f}/s[lblack], {stats['pending']} pending, "
+                f"{stats['resumed']} resumed, {stats['rejected']} rejected, {stats['failed']} failed, {stats['keys']} keys ready ({stats['misses']} generated inline)"
+            )
+
+    def report_queues(self) -> None:
+        while True:
+            time.sleep(_QUEUE_REPORT)
+            depths = [client.queue_depth() for client in self.clients.snapshot()]
+            self.console.print(
+                f"[lblack]Send queues: [yellow]{sum(depths)} queued[lblack] over {len(depths)} clients (deepest {max(depths, default = 0)}), "
+                f"{totals.dropped} dropped, {totals.kicked} clients disconnected for falling behind"
+            )
+
+    def report_memory(self) -> None:
+        while True:
+            time.sleep(_MEMORY_REPORT)
+            clients = self.clients.snapshot()
+            peaks = [client.buffer_peak() for client in clients]
+            grown = sum(peak > client.sock.buffer_size for client, peak in zip(clients, peaks))
+            self.console.print(
+                f"[lblack]Receive buffers: [yellow]{memory.used // 1024}kb reserved[lblack] of {memory.total // 1024}kb, "
+                f"largest peak {max(peaks, default = 0) // 1024}kb, {grown} of {len(peaks)} clients grew past {self.wrap.buffer_size // 1024}kb"
+            )
+
+    def serve(self) -> None:
+        if config.get("mode") == "async":
+            return self.start_async()
+
+        elif self.bus is not None:
+            self.bus.start(self.on_bus, self.bus_lost)
+
+        # Client handler (handshakes run on the handshake pool, so accepting never waits on a client)
+        handshakes.start()
         while True:
             try:
                 conn, addr = self.sock.accept()
-                client = Client(self, (conn, addr))
+                if not handshakes.admit(addr[0]):
+                    conn.close()
+                    continue
 
-                # Handle thread
-                self.clients.append(client)
-                Thread(target = client.handle).start()
+                client = Client(self, (conn, addr))
+                self.clients.add(client)
+                handshakes.submit(client)
 
             except KeyboardInterrupt:
                 return self.close()
 
-    def broadcast(self, data: dict) -> None:
-        data = json.loads(em(json.dumps(data)))
-        for client in self.clients:
+    def start_workers(self, count: int) -> None:
+        path = config.get("bus") or os.path.join(tempfile.gettempdir(), f"plasma-{os.getpid()}.sock")
+        hub = BusHub(path)
+
+        # Launch workers (each one binds the port itself)
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target = self.start_worker, args = (path, count)) for _ in range(count)]
+        for worker in workers:
+            worker.start()
+
+        # Start text
+        self.console.clear()
+        self.console.print(f"[blue]Server running on [yellow]0.0.0.0:2075[blue] with [yellow]{count}[blue] workers..")
+        try:
+            hub.serve()
+
+        except KeyboardInterrupt:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            for worker in workers:
+                worker.terminate()
+                worker.join()
+
+            hub.close()
+            self.console.print("\r[red]^C | Server shutdown successfully.")
+            os._exit(0)
+
+    def start_worker(self, path: str, count: int) -> None:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent stops workers with SIGTERM
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+        self.sock = Socket(reuse_port = True)
+        self.bus = Bus(path)
+        memory.share(count)
+
+        self.listen()
+        self.serve()
+
+    def bus_lost(self) -> None:
+        self.console.print("[red]Lost connection to the worker bus, stopping worker..")
+        self.console.flush()
+        os._exit(1)
+
+    def on_bus(self, data: dict) -> None:
+        if data["op"] == "broadcast":
+            return self.deliver(data["data"], channel = data["channel"])
+
+        # Roster changes from the hub (already ordered and versioned)
+        with self.clients.lock:
+            self.bus.apply(data)
+            if data["op"] != "roster":
+                self.deliver({
+                    "type": f"g.{data['op']}",
+                    "data": {
+                        "author": {"uid": "system", "name": "System"},
+                        "content": {"version": data["version"], "user": data["user"]},
+                        "timestamp": time.time()
+                    }
+                }, roster = True)
+
+    def start_async(self) -> None:
+        try:
+            asyncio.run(self.serve_async())
+
+        except KeyboardInterrupt:
+            return self.close()
+
+    async def serve_async(self) -> None:
+        self.sock.setblocking(False)
+        self.loop = asyncio.get_running_loop()
+        if self.bus is not None:
+            self.bus.start(lambda data: self.loop.call_soon_threadsafe(self.on_bus, data), self.bus_lost)
+
+        # Client handler
+        server = await self.loop.create_server(lambda: AsyncSocketWrapper(self), sock = self.sock)
+        async with server:
+            await server.serve_forever()
+
+    def accept_async(self, wrap: AsyncSocketWrapper, addr: tuple) -> None:
+        if not handshakes.admit(addr[0]):
+            return wrap.close()
+
+        client = Client(self, (wrap, addr))
+
+        # Handle task
+        self.clients.add(client)
+        self.loop.create_task(client.handle_async())
+
+    def deliver(self, data: dict, roster: bool = False, channel: str = None) -> None:
+        if channel is not None:
+            clients = self.channels.record(channel, data)
+
+        else:
+            clients = self.clients.authed()  # Others may not have finished the handshake
+
+        frames = {}  # One frame per guild format (with or without the user list)
+        key = self.group if self.rotation is None else None  # A member that just left still holds the group key
+        for client in clients:
+            if roster and not client.roster:
+                continue
+
             try:
-                client.sock.send_json(data)
+                if client.roster not in frames:
+                    frames[client.roster] = Frame(data | {"guild": client.guild()})
+
+                client.sock.send_frame(frames[client.roster], key, droppable = not roster)  # A missed roster delta would desync the client
 
             except OSError:
-                self.clients.remove(client)
+                client.shutdown()
+
+    def broadcast(self, data: dict, roster: bool = False, channel: str = None) -> None:
+        if isinstance(data["data"].get("content"), str):
+            data = data | {"data": data["data"] | {"content": em(data["data"]["content"])}}  # Once, before any worker or channel sees it
+
+        if self.bus is not None and not roster:
+            self.bus.publish(data, channel)  # Roster changes reach other workers through the hub instead
+
+        self.deliver(data, roster, channel)
 
-        # Print to server
-        ts = datetime.now().strftime("%H:%M")
-        if data["type"] in ["m.msg", "u.join", "u.leave"]:
+        # Print to server (queued, the console's writer thread renders and writes it)
+        if data["type"] in ["m.msg", "u.join", "u.leave"] and not self.console.quiet:
+            ts = datetime.now().strftime("%H:%M")
             internal_dt = data["data"]
             lines = internal_dt["content"].split("\n")
-            def generate_prefix() -> str:  # noqa
-                return f"[cyan]{ts} [lgreen]{internal_dt['author']['name']}[reset] "
+            tag = f"[lblack]#{channel} " if channel is not None else ""
+            prefix = f"[cyan]{ts} {tag}[lgreen]{internal_dt['author']['name']}[reset] "
+            indent = " " * len(self.console.print(prefix, color = False))
 
-            self.console.print(f"{generate_prefix()}[lblack]| [reset]{lines[0]}[reset]")
+            # The prefix repeats for every line a user sends that minute, so it comes rendered from the cache
+            self.console.print(self.console.fragment(f"{prefix}[lblack]| [reset]") + f"{lines[0]}[reset]")
             for line in lines[1:]:
-                self.console.print(f"{' ' * len(self.console.print(generate_prefix(), color = False))}[lblack]| [reset]{line}[reset]")
+                self.console.print(self.console.fragment(f"{indent}[lblack]| [reset]") + f"{line}[reset]")
 
 # Initialization
 server = Server()
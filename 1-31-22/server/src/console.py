@@ -3,13 +3,34 @@
 # Modules
 import os
 import re
+import sys
 import shutil
+from collections import deque
+from functools import lru_cache
+from threading import Thread, Condition
+
+# Tag patterns
+_TAG_PATTERN   = re.compile(r"\[(/?)([a-zA-Z]+)\]")  # [tag] and [/tag]
+_STRIP_PATTERN = re.compile(r"\[/*[a-zA-Z]+\]")
+_RENDER_CACHE  = 1024                                # Rendered fragments kept (prompts, prefixes)
 
 # Console class
+# Once started, printed lines are queued and a writer thread renders them and
+# writes everything that piled up in one go, so a slow terminal never holds up
+# a broadcast; lines that don't fit the queue are dropped and counted instead
 class Console(object):
-    def __init__(self) -> None:
+    def __init__(self, quiet: bool = False, limit: int = 1024) -> None:
         self._clear_cmd = "clear" if os.name != "nt" else "cls"
 
+        # Output queue
+        self.quiet = quiet  # Chat isn't printed at all
+        self.limit = limit  # Lines waiting to be written before new ones are dropped
+        self.lines = deque()
+        self.dropped = 0
+        self.running = False
+        self.writing = False
+        self._cond = Condition()
+
         # Color map
         self._color_map = {
 
@@ -39,14 +60,28 @@ class Console(object):
         for _rs in [self._color_map["norm"], self._color_map["bgreset"]]:
             self._color_map["reset"] += _rs
 
+        # Tags are rendered (or stripped) in one pass; fragments that repeat, like
+        # prompts and prefixes, are cached, whole lines are unique so they never are
+        self.fragment = lru_cache(maxsize = _RENDER_CACHE)(self.fragment)
+
     def _to_ansi(self, code: int) -> str:
         return f"\033[{code}m"
 
+    def _replace_tag(self, match: re.Match) -> str:
+        tag = match.group(2)
+        if tag not in self._color_map:
+            return match.group(0)
+
+        return self._color_map["reset"] if match.group(1) else self._color_map[tag]
+
+    def _render(self, text: str) -> str:
+        return _TAG_PATTERN.sub(self._replace_tag, text)
+
     def _strip_tags(self, text: str) -> str:
-        for tag in re.findall(r"\[\/*[a-zA-Z]{1,}\]", text):
-            text = text.replace(tag, "")
+        return _STRIP_PATTERN.sub("", text)
 
-        return text
+    def fragment(self, text: str) -> str:
+        return self._render(text)
 
     def ts(self) -> str:
         return " " * shutil.get_terminal_size().columns
@@ -58,12 +93,57 @@ class Console(object):
         if not color:
             return self._strip_tags(text)
 
-        # Process tags | TODO: Make a much better, recursive system
-        text += ("[reset]" if not text.endswith("[reset]") else "")
-        for tag in self._color_map:
-            text = text.replace(f"[{tag}]", self._color_map[tag]).replace(f"[/{tag}]", self._color_map["reset"])
+        if print_out and self.running:
+            return self.write(text, kwargs.get("end", "\n"))
 
+        # Process tags
+        text = self._render_line(text, "")
         if not print_out:
             return text
 
         return print(text, **kwargs)
+
+    # Writer
+    def write(self, text: str, end: str = "\n") -> None:
+        with self._cond:
+            if len(self.lines) >= self.limit:
+                self.dropped += 1
+                return
+
+            self.lines.append((text, end))
+            self._cond.notify_all()
+
+    def start(self) -> None:
+        self.running = True
+        Thread(target = self._writer, daemon = True).start()
+
+    def flush(self, timeout: float = 1) -> None:
+        with self._cond:
+            self._cond.wait_for(lambda: not (self.lines or self.writing or self.dropped), timeout)
+
+    def _render_line(self, text: str, end: str = "\n") -> str:
+        return self._render(text + ("[reset]" if not text.endswith("[reset]") else "")) + end
+
+    def _writer(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self.lines or self.dropped)
+                lines, dropped = list(self.lines), self.dropped
+                self.lines.clear()
+                self.dropped, self.writing = 0, True
+
+            # Rendered here, off the broadcasting thread, and written as one batch
+            output = "".join(self._render_line(text, end) for text, end in lines)
+            if dropped:
+                output += self._render_line(f"[lblack]({dropped} lines dropped, the console couldn't keep up)")
+
+            try:
+                sys.stdout.write(output)
+                sys.stdout.flush()
+
+            except (OSError, ValueError):
+                pass
+
+            with self._cond:
+                self.writing = False
+                self._cond.notify_all()
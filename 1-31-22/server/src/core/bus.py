@@ -0,0 +1,266 @@
+# Copyright 2021 iiPython
+
+# Modules
+import os
+import json
+import socket
+import asyncio
+from itertools import count
+from threading import Thread, Lock, Event
+
+from . import framing
+
+# Frame kinds (on the bus only)
+KIND_CONTROL = framing.KIND_JSON   # Claims and roster events, handled by the hub
+KIND_BROADCAST = 1                 # Packets relayed verbatim to every other worker
+
+# Bus connection (length prefixed frames over a unix socket)
+class BusConnection(object):
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.lock = Lock()
+        self.decoder = framing.FrameDecoder(framing.LENGTH_PREFIXED, size = 65536)
+
+    def send(self, payload: bytes, kind: int = KIND_CONTROL) -> None:
+        with self.lock:
+            self.sock.sendall(framing.pack(payload, framing.LENGTH_PREFIXED, kind))
+
+    def send_json(self, data: dict) -> None:
+        return self.send(json.dumps(data).encode("utf8"))
+
+    def frames(self):
+        while True:
+            frame = self.decoder.next()
+            if frame is not None:
+                yield frame[0], bytes(frame[1])
+                continue
+
+            size = self.sock.recv_into(self.decoder.writable(65536))
+            if not size:
+                return
+
+            self.decoder.written(size)
+
+    def close(self) -> None:
+        self.sock.close()
+
+# Bus hub (runs in the parent process)
+# The hub is the single owner of the name table and the roster version, so
+# names stay unique across workers and every worker sees roster changes in
+# the same order; broadcasts are forwarded without being decoded
+class BusHub(object):
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.peers = []
+        self.lock = Lock()
+
+        # Roster
+        self.names = {}  # casefolded name -> [peer, user, announced, claim id]
+        self.version = 0
+
+        # Listen socket
+        if os.path.exists(path):
+            os.remove(path)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(64)
+
+    def serve(self) -> None:
+        while True:
+            conn, _ = self.sock.accept()
+            peer = BusConnection(conn)
+            with self.lock:
+                self.peers.append(peer)
+                peer.send_json({"op": "roster", "version": self.version, "users": self.users()})
+
+            Thread(target = self.handle, args = (peer,), daemon = True).start()
+
+    def close(self) -> None:
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def users(self) -> list:
+        return [entry[1] for entry in self.names.values() if entry[2]]
+
+    def emit(self, data: dict) -> None:
+        payload = json.dumps(data).encode("utf8")
+        for peer in self.peers:
+            try:
+                peer.send(payload)
+
+            except OSError:
+                pass
+
+    def handle(self, peer: BusConnection) -> None:
+        try:
+            for kind, payload in peer.frames():
+                if kind == KIND_BROADCAST:
+                    for other in self.peers:
+                        if other is not peer:
+                            try:
+                                other.send(payload, kind)
+
+                            except OSError:
+                                pass
+
+                else:
+                    self.control(peer, json.loads(payload))
+
+        except OSError:
+            pass
+
+        # Release everything the worker held
+        with self.lock:
+            self.peers.remove(peer)
+            for key, entry in list(self.names.items()):
+                if entry[0] is peer:
+                    self.release(key)
+
+        peer.close()
+
+    def release(self, key: str) -> None:
+        peer, user, announced, request = self.names.pop(key)
+        if announced:
+            self.version += 1
+            self.emit({"op": "roster_remove", "version": self.version, "user": user})
+
+    def control(self, peer: BusConnection, data: dict) -> None:
+        op, user = data["op"], data["user"]
+        key = user["name"].casefold()
+        with self.lock:
+            entry = self.names.get(key)
+            if op == "claim":
+                if entry is None:
+                    self.names[key] = [peer, user, False, data["id"]]
+
+                peer.send_json({"op": "reply", "id": data["id"], "ok": entry is None})
+
+            elif entry is None or entry[0] is not peer:
+                return
+
+            elif op == "roster_add" and not entry[2]:
+                entry[2] = True
+                self.version += 1
+                self.emit({"op": "roster_add", "version": self.version, "user": user})
+
+            elif op == "roster_remove" or (op == "cancel" and entry[3] == data["id"]):
+                self.release(key)
+
+# Bus client (one per worker)
+class Bus(object):
+    def __init__(self, path: str) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(path)
+        self.conn = BusConnection(sock)
+
+        # Pending claims
+        self.pending = {}
+        self._ids = count(1)
+
+        # Roster mirror (every worker's users, in hub order)
+        self.users = {}
+        self.version = 0
+
+    def start(self, handler, on_close) -> None:
+        Thread(target = self.reader, args = (handler, on_close), daemon = True).start()
+
+    def reader(self, handler, on_close) -> None:
+        try:
+            for kind, payload in self.conn.frames():
+                data = json.loads(payload)
+                if kind == KIND_BROADCAST:
+                    handler({"op": "broadcast", "data": data["packet"], "channel": data["channel"]})
+
+                elif data["op"] == "reply":
+                    resolve = self.pending.pop(data["id"], None)
+                    if resolve is not None:  # Otherwise the claim timed out
+                        resolve(data["ok"])
+
+                else:
+                    handler(data)
+
+        except OSError:
+            pass
+
+        on_close()
+
+    # Roster
+    def apply(self, data: dict) -> None:
+        self.version = data["version"]
+        if data["op"] == "roster":
+            self.users = {user["name"].casefold(): user for user in data["users"]}
+
+        elif data["op"] == "roster_add":
+            self.users[data["user"]["name"].casefold()] = data["user"]
+
+        elif data["op"] == "roster_remove":
+            self.users.pop(data["user"]["name"].casefold(), None)
+
+    def roster(self) -> dict:
+        return {"version": self.version, "users": list(self.users.values())}
+
+    # Requests
+    def _claim(self, user: dict, resolve) -> int:
+        request = next(self._ids)
+        self.pending[request] = resolve  # Called from the reader thread with the hub's answer
+        try:
+            self.conn.send_json({"op": "claim", "id": request, "user": user})
+            return request
+
+        except OSError:
+            self.pending.pop(request, None)
+            return None
+
+    def _cancel(self, request: int, user: dict) -> None:
+        self.pending.pop(request, None)
+        try:
+            self.conn.send_json({"op": "cancel", "id": request, "user": user})  # Drop the reservation if the hub made one
+
+        except OSError:
+            pass
+
+    def claim(self, user: dict, timeout: float = 5) -> bool:
+        result, event = [], Event()
+        request = self._claim(user, lambda ok: (result.append(ok), event.set()))
+        if request is None:
+            return False
+
+        elif not event.wait(timeout):
+            self._cancel(request, user)
+            return False
+
+        return result[0]
+
+    async def claim_async(self, user: dict, timeout: float = 5) -> bool:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        def resolve(ok: bool) -> None:  # noqa
+            if not future.done():
+                future.set_result(ok)
+
+        request = self._claim(user, lambda ok: loop.call_soon_threadsafe(resolve, ok))
+        if request is None:
+            return False
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+
+        except asyncio.TimeoutError:
+            self._cancel(request, user)
+            return False
+
+    def announce(self, op: str, user: dict) -> None:
+        try:
+            self.conn.send_json({"op": op, "user": user})
+
+        except OSError:
+            pass
+
+    def publish(self, data: dict, channel: str = None) -> None:
+        try:
+            self.conn.send(json.dumps({"packet": data, "channel": channel}).encode("utf8"), KIND_BROADCAST)
+
+        except OSError:
+            pass
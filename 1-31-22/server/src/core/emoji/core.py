@@ -3,13 +3,44 @@
 # Taken to reduce dependency count
 
 # Modules
+import os
 import re
-from .emojis import EMOJI_ALIAS_UNICODE_ENGLISH
-def em(string: str) -> str:
-    pattern = re.compile(u'(%s[\\w\\-&.’”“()!#*+?–,/]+%s)' % (":", ":"), flags = re.UNICODE)
-    def replace(match):  # noqa
-        mg = match.group(1).replace(":", ":").replace(":", ":")
-        emj = EMOJI_ALIAS_UNICODE_ENGLISH.get(mg, mg)
-        return emj
-
-    return pattern.sub(replace, string)
+from threading import Lock
+
+# Configuration
+_EMOJI_FILE = os.path.join(os.path.dirname(__file__), "emojis.txt")  # Sorted "shortcode<tab>emoji" lines
+
+# Emoji engine
+# The shortcode pattern is compiled once and finds every :shortcode: in a
+# single pass; text without a colon (most chat) is handed straight back, and
+# the table itself isn't read until the first message that might need it
+class EmojiEngine(object):
+    PATTERN = re.compile(u"(:[\\w\\-&.’”“()!#*+?–,/]+:)", flags = re.UNICODE)
+
+    def __init__(self, path: str = _EMOJI_FILE) -> None:
+        self.path = path
+        self._table = None
+        self._lock = Lock()
+
+    @property
+    def table(self) -> dict:
+        if self._table is None:
+            with self._lock:
+                if self._table is None:
+                    with open(self.path, "r", encoding = "utf8") as file:
+                        self._table = dict(line.split("\t") for line in file.read().splitlines())
+
+        return self._table
+
+    def _lookup(self, match: re.Match) -> str:
+        return self.table.get(match.group(1), match.group(1))
+
+    def replace(self, text: str) -> str:
+        if ":" not in text:
+            return text
+
+        return self.PATTERN.sub(self._lookup, text)
+
+# Initialization
+engine = EmojiEngine()
+em = engine.replace
@@ -0,0 +1,44 @@
+# Copyright 2021 iiPython
+
+# Modules
+import os
+import struct
+
+from . import framing
+from .config import config
+
+try:
+    from Crypto.Cipher import AES
+
+except ImportError:
+    AES = None
+
+# Configuration
+_GROUP_CONFIG = config.get("group") or {}
+_GROUP_DELAY  = _GROUP_CONFIG.get("delay", 0.25)  # Seconds leaves are gathered into one key rotation
+
+# Group key class
+# Every member gets the key over their own DH channel (s.key), so a broadcast
+# is encrypted once and the same ciphertext goes to everyone; the server
+# moves to a new epoch whenever a member leaves
+class GroupKey(object):
+    HEADER = struct.Struct(">I")
+
+    def __init__(self, epoch: int = 1) -> None:
+        self.epoch = epoch
+        self.key = os.urandom(32)
+
+    def seal(self, data: bytes) -> bytes:
+        nonce = os.urandom(12)
+        ciphertext, tag = AES.new(self.key, AES.MODE_GCM, nonce = nonce).encrypt_and_digest(data)
+        return framing.pack(self.HEADER.pack(self.epoch) + nonce + tag + ciphertext, framing.LENGTH_PREFIXED, framing.KIND_GROUP)
+
+    def rotate(self):
+        return GroupKey(self.epoch + 1)
+
+    def to_dict(self) -> dict:
+        return {"epoch": self.epoch, "key": self.key.hex()}
+
+# Helpers
+def available() -> bool:
+    return AES is not None
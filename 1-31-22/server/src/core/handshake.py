@@ -0,0 +1,249 @@
+# Copyright 2021 iiPython
+
+# Modules
+import time
+import random
+import socket
+import selectors
+from queue import SimpleQueue
+from collections import deque
+from iipython import Hellman
+from threading import Thread, Lock, Condition
+
+from .config import config
+
+# Configuration
+_HANDSHAKE_CONFIG  = config.get("handshake") or {}
+_HANDSHAKE_POOL    = _HANDSHAKE_CONFIG.get("pool", 64)     # Key pairs generated ahead of time
+_HANDSHAKE_WORKERS = _HANDSHAKE_CONFIG.get("workers", 4)   # Threads finishing key exchanges (thread mode)
+_HANDSHAKE_QUEUE   = _HANDSHAKE_CONFIG.get("queue", 128)   # Connections allowed to wait on (or be in) a handshake
+_HANDSHAKE_SOURCE  = _HANDSHAKE_CONFIG.get("source", 8)    # Of those, how many can come from one address
+_HANDSHAKE_TIMEOUT = _HANDSHAKE_CONFIG.get("timeout", 2)   # in seconds
+_HANDSHAKE_REPORT  = _HANDSHAKE_CONFIG.get("report", 0)    # Seconds between metric reports (0 to disable)
+_HANDSHAKE_WINDOW  = 10                                    # Seconds the handshake rate is averaged over
+
+# Key pool class
+# Generating a key pair is the expensive part of a handshake, so a background
+# thread keeps a pool of them ready while the server is idle; a reconnect
+# storm drains the pool first and only generates inline once it runs dry
+class KeyPool(object):
+    def __init__(self, size: int = _HANDSHAKE_POOL) -> None:
+        self.size = size
+        self.keys = deque()
+        self.misses = 0  # Key pairs generated inline because the pool was empty
+
+        self._cond = Condition()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def generate(self) -> Hellman:
+        return Hellman(
+            random.randint(1000, 9999),
+            random.randint(10 ** 15, 15 ** 15)
+        )
+
+    def start(self) -> None:
+        if self.size:
+            Thread(target = self._filler, daemon = True).start()
+
+    def _filler(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self.keys) < self.size)
+
+            self.keys.append(self.generate())
+
+    def take(self) -> Hellman:
+        with self._cond:
+            self._cond.notify()
+            if self.keys:
+                return self.keys.popleft()
+
+            self.misses += 1
+
+        return self.generate()
+
+    def put(self, hellman: Hellman) -> None:
+        with self._cond:
+            if len(self.keys) < self.size:
+                self.keys.append(hellman)  # Back of the line, fresh pairs go first
+
+# Handshake pool class
+# Accepting only admits a connection and sends it the handshake; a selector
+# waits for the replies, so the worker threads only ever run a key exchange
+# for a reply that has fully arrived and idle connections can't tie them up.
+# Once the queue (or one address's share of it) is full, new connections are
+# closed straight away instead of piling up behind slow handshakes
+class HandshakePool(object):
+    def __init__(self, workers: int = _HANDSHAKE_WORKERS, limit: int = _HANDSHAKE_QUEUE, source: int = _HANDSHAKE_SOURCE) -> None:
+        self.workers = workers
+        self.limit = limit
+        self.source = source
+
+        # Accounting
+        self.pending = 0
+        self.sources = {}  # Address -> pending handshakes
+        self.rejected = 0
+        self.completed = 0
+        self.resumed = 0  # Completed by a resumption ticket instead of a key exchange
+        self.failed = 0
+
+        # Replies being waited on (client -> deadline)
+        self.waiting = {}
+        self.selector = None  # Made by start(), after any worker processes have forked
+        self._wake = None
+
+        self.queue = SimpleQueue()
+        self._lock = Lock()
+        self._rate = deque(maxlen = _HANDSHAKE_WINDOW)  # [second, handshakes]
+
+    def start(self) -> None:
+        self.selector = selectors.DefaultSelector()
+        self._wake = socket.socketpair()
+        for sock in self._wake:
+            sock.setblocking(False)
+
+        self.selector.register(self._wake[0], selectors.EVENT_READ)
+        for _ in range(self.workers):
+            Thread(target = self._worker, daemon = True).start()
+
+        Thread(target = self._poller, daemon = True).start()
+
+    def _worker(self) -> None:
+        while True:
+            client, packet = self.queue.get()
+            try:
+                if client.handshake(packet):
+                    Thread(target = client.handle).start()
+
+            except Exception:
+                continue  # handshake() already counted it, a bad client must never end the worker
+
+    def _poller(self) -> None:
+        while True:
+            for key, _ in self.selector.select(timeout = .25):
+                if key.data is None:
+                    self._wake[0].recv(4096)
+                    continue  # A new registration, picked up by the next select()
+
+                client = key.data
+                try:
+                    packet = client.read_handshake()
+                    if packet is None:
+                        continue  # Only part of the reply so far
+
+                    self._unwatch(client)
+                    self.queue.put((client, packet))
+
+                except Exception:
+                    if self._unwatch(client):
+                        client.handshake_failed()
+
+            # Replies that never showed up in time
+            now = time.monotonic()
+            with self._lock:
+                expired = [client for client, deadline in self.waiting.items() if deadline < now]
+
+            for client in expired:
+                if self._unwatch(client):
+                    client.handshake_failed()
+
+    def _unwatch(self, client) -> bool:
+        with self._lock:
+            if self.waiting.pop(client, None) is None:
+                return False
+
+        try:
+            self.selector.unregister(client.sock.sock)
+
+        except (KeyError, ValueError):
+            pass  # Closed under us
+
+        return True
+
+    # Admission
+    def admit(self, source: str = None) -> bool:
+        with self._lock:
+            if self.pending >= self.limit or self.sources.get(source, 0) >= self.source:
+                self.rejected += 1
+                return False
+
+            self.pending += 1
+            self.sources[source] = self.sources.get(source, 0) + 1
+            return True
+
+    def submit(self, client) -> None:
+        try:
+            client.start_handshake()
+
+        except Exception:
+            return client.handshake_failed()
+
+        self.watch(client)
+
+    def watch(self, client) -> None:
+        with self._lock:
+            self.waiting[client] = time.monotonic() + _HANDSHAKE_TIMEOUT
+
+        try:
+            self.selector.register(client.sock.sock, selectors.EVENT_READ, client)
+
+        except (KeyError, OSError, ValueError):
+            if self._unwatch(client):
+                client.handshake_failed()
+
+            return
+
+        # select() based selectors only see sockets registered before the call
+        try:
+            self._wake[1].send(b"\0")
+
+        except BlockingIOError:
+            pass  # Already awake
+
+    def cancel(self, client) -> None:
+        if self._unwatch(client):
+            self.finish(False, source = client.addr[0])  # Closed while its reply was being waited on
+
+    def finish(self, success: bool, resumed: bool = False, source: str = None) -> None:
+        second = int(time.monotonic())
+        with self._lock:
+            self.pending -= 1
+            self.sources[source] -= 1
+            if not self.sources[source]:
+                del self.sources[source]
+
+            if not success:
+                self.failed += 1
+                return
+
+            self.completed += 1
+            self.resumed += resumed
+            if self._rate and self._rate[-1][0] == second:
+                self._rate[-1][1] += 1
+
+            else:
+                self._rate.append([second, 1])
+
+    # Metrics
+    def rate(self) -> float:
+        since = int(time.monotonic()) - _HANDSHAKE_WINDOW
+        with self._lock:
+            return sum(count for second, count in self._rate if second > since) / _HANDSHAKE_WINDOW
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate(),
+            "pending": self.pending,
+            "completed": self.completed,
+            "resumed": self.resumed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "keys": len(keys),
+            "misses": keys.misses
+        }
+
+# Initialization
+keys = KeyPool()
+handshakes = HandshakePool()
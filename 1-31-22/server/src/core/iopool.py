@@ -0,0 +1,99 @@
+# Copyright 2021 iiPython
+
+# Modules
+from queue import SimpleQueue
+from collections import deque
+from threading import Thread, Condition
+
+from .config import config
+
+# Configuration
+_IO_CONFIG  = config.get("io") or {}
+_IO_WORKERS = _IO_CONFIG.get("workers", 4)   # Threads doing file reads and writes
+_IO_PENDING = _IO_CONFIG.get("pending", 16)  # Jobs a connection can have queued before it stops being read
+
+# I/O lane class
+# Jobs from one connection run one at a time and in order (an upload's chunks
+# have to hit the disk in sequence), while different connections' lanes run
+# side by side; results go back through deliver, which the connection picks
+class IOLane(object):
+    def __init__(self, pool, deliver, block: bool = True, limit: int = _IO_PENDING) -> None:
+        self.pool = pool
+        self.deliver = deliver  # deliver(func, *args) runs func wherever the connection wants it
+        self.block = block      # Submitting to a full lane waits (thread mode), or calls on_full (async mode)
+        self.limit = limit
+
+        self.jobs = deque()
+        self.running = False
+        self.on_full = None
+        self.on_drain = None
+
+        self._cond = Condition()
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def full(self) -> bool:
+        return len(self.jobs) >= self.limit
+
+    def submit(self, func, args: tuple = (), callback = None, force: bool = False) -> None:
+        with self._cond:
+            while self.block and not force and self.full():
+                self._cond.wait()
+
+            self.jobs.append((func, args, callback))
+            if not self.running:
+                self.running = True
+                self.pool.queue.put(self)
+
+            full = self.full()
+
+        if full and self.on_full is not None:
+            self.on_full()
+
+    def run(self) -> None:
+        func, args, callback = self.jobs[0]
+        try:
+            result, error = func(*args), None
+
+        except Exception as err:
+            result, error = None, err
+
+        if callback is not None:
+            self.deliver(callback, result, error)
+
+        with self._cond:
+            self.jobs.popleft()
+            drained = len(self.jobs) == self.limit - 1
+            self._cond.notify_all()
+            if self.jobs:
+                self.pool.queue.put(self)  # Back of the line, so one busy connection can't hog the pool
+
+            else:
+                self.running = False
+
+        if drained and self.on_drain is not None:
+            self.deliver(self.on_drain)
+
+# I/O pool class
+# Disk work (upload chunks, stored files, download reads in async mode) runs
+# here instead of on a connection's read loop, so a slow disk only holds up
+# the connection waiting on it, and chat on that connection keeps going
+class IOPool(object):
+    def __init__(self, workers: int = _IO_WORKERS) -> None:
+        self.workers = workers
+        self.queue = SimpleQueue()
+
+    def start(self) -> None:
+        for _ in range(self.workers):
+            Thread(target = self._worker, daemon = True).start()
+
+    def _worker(self) -> None:
+        while True:
+            self.queue.get().run()
+
+    def lane(self, deliver, block: bool = True) -> IOLane:
+        return IOLane(self, deliver, block)
+
+# Initialization
+iopool = IOPool()
@@ -0,0 +1,115 @@
+# Copyright 2021 iiPython
+
+# Modules
+import time
+from threading import Thread, Condition
+
+from .config import config
+
+try:
+    import psutil
+
+except ImportError:
+    psutil = None
+
+# Configuration
+_MEMORY_CONFIG = config.get("memory") or {}
+_MEMORY_BUDGET = _MEMORY_CONFIG.get("budget")       # in Megabytes
+_MEMORY_REFRESH = _MEMORY_CONFIG.get("refresh", 5)  # in seconds
+_MEMORY_REPORT = _MEMORY_CONFIG.get("report", 0)    # Seconds between buffer reports (0 to disable)
+_MEMORY_DEFAULT = 256 * 1048576                     # Used without psutil
+
+# Memory budget class
+# Connections reserve receive buffer memory here as their buffers grow and
+# release it as they shrink; the system memory figure is only refreshed on a
+# timer, never on the packet path
+class MemoryBudget(object):
+    def __init__(self, budget: int = _MEMORY_BUDGET, refresh: float = _MEMORY_REFRESH) -> None:
+        self.budget = int(budget * 1048576) if budget else None
+        self.interval = refresh
+
+        # Accounting
+        self.total = 0
+        self.used = 0
+        self.owners = 0
+        self.shares = 1  # Worker processes splitting the budget
+
+        self.waiters = []
+        self._cond = Condition()
+        self.refresh()
+
+    def refresh(self) -> None:
+        if self.budget is not None:
+            total = self.budget
+
+        elif psutil is not None:
+            total = round(psutil.virtual_memory().available / 2) + self.used
+
+        else:
+            total = _MEMORY_DEFAULT
+
+        with self._cond:
+            self.total = total // self.shares
+
+        self._notify()
+
+    def share(self, count: int) -> None:
+        self.shares = count
+        self.refresh()
+
+    def start(self) -> None:
+        Thread(target = self._refresher, daemon = True).start()
+
+    def _refresher(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.refresh()
+
+    def _notify(self) -> None:
+        with self._cond:
+            waiters, self.waiters = self.waiters, []
+            self._cond.notify_all()
+
+        for callback in waiters:
+            callback()
+
+    # Quotas
+    def free(self) -> int:
+        return max(self.total - self.used, 0)
+
+    def quota(self) -> int:
+        return max(self.total // max(self.owners, 1), 1)
+
+    def register(self) -> None:
+        with self._cond:
+            self.owners += 1
+
+    def unregister(self, size: int) -> None:
+        with self._cond:
+            self.owners -= 1
+
+        self.release(size)
+
+    def reserve(self, size: int, timeout: float = None, force: bool = False, callback = None) -> bool:
+        with self._cond:
+            if not force and self.used + size > self.total:
+                if not timeout or not self._cond.wait_for(lambda: self.used + size <= self.total, timeout):
+                    if callback is not None:
+                        self.waiters.append(callback)  # Called once memory frees up
+
+                    return False
+
+            self.used += size
+            return True
+
+    def release(self, size: int) -> None:
+        if size <= 0:
+            return
+
+        with self._cond:
+            self.used -= size
+
+        self._notify()
+
+# Initialization
+memory = MemoryBudget()
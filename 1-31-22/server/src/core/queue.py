@@ -0,0 +1,128 @@
+# Copyright 2021 iiPython
+
+# Modules
+import time
+from collections import deque
+from threading import Condition, Lock
+
+from .config import config
+
+# Configuration
+_QUEUE_CONFIG = config.get("queue") or {}
+_QUEUE_SIZE = _QUEUE_CONFIG.get("size", 256)
+_QUEUE_POLICY = _QUEUE_CONFIG.get("policy", "drop")
+_QUEUE_TIMEOUT = _QUEUE_CONFIG.get("timeout", 10)
+_QUEUE_LIMIT = int(_QUEUE_CONFIG.get("limit", 1024) * 1024)  # in Kilobytes, how large a coalesced backlog can get
+_QUEUE_REPORT = _QUEUE_CONFIG.get("report", 0)                # Seconds between queue reports (0 to disable)
+
+# Queue totals class (every connection's queue counts here, for the queue report)
+class QueueTotals(object):
+    def __init__(self) -> None:
+        self.dropped = 0
+        self.kicked = 0  # Clients disconnected for falling too far behind
+        self._lock = Lock()
+
+    def add(self, dropped: int = 0, kicked: int = 0) -> None:
+        with self._lock:
+            self.dropped += dropped
+            self.kicked += kicked
+
+# Send queue class
+# Only broadcasts are ever dropped, control frames (keys, tickets, transfer
+# replies) are never dropped; a client whose backlog holds nothing droppable,
+# or whose coalesced backlog outgrows the byte limit, is disconnected instead
+class SendQueue(object):
+    def __init__(self, size: int = _QUEUE_SIZE, policy: str = _QUEUE_POLICY, timeout: float = _QUEUE_TIMEOUT, limit: int = _QUEUE_LIMIT) -> None:
+        if policy not in ["drop", "coalesce", "disconnect"]:
+            raise ValueError(f"unknown queue policy: {policy}")
+
+        self.size = size
+        self.policy = policy
+        self.timeout = timeout
+        self.limit = limit
+
+        # Storage
+        self.frames = deque()
+        self.stamps = deque()
+        self.marks = deque()  # Whether each frame may be dropped
+        self.bytes = 0
+        self.inflight = None
+
+        self.closed = False
+        self._cond = Condition()
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def age(self) -> float:
+        oldest = self.inflight or (self.stamps[0] if self.stamps else None)
+        return (time.time() - oldest) if oldest is not None else 0
+
+    def put(self, frame: bytes, droppable: bool = False) -> None:
+        with self._cond:
+            if self.closed:
+                raise OSError
+
+            elif self.policy == "disconnect" and self.age() > self.timeout:
+                self._kick()
+
+            # Handle slow consumers
+            if len(self.frames) >= self.size:
+                if self.policy == "coalesce":
+                    if self.bytes + len(frame) > self.limit:
+                        self._kick()
+
+                    self.frames, stamp = deque([b"".join(self.frames)]), self.stamps[0]
+                    self.stamps, self.marks = deque([stamp]), deque([False])
+
+                else:
+                    self._drop()
+
+            self.frames.append(frame)
+            self.stamps.append(time.time())
+            self.marks.append(droppable)
+            self.bytes += len(frame)
+            self._cond.notify()
+
+    def _drop(self) -> None:
+        for index, droppable in enumerate(self.marks):
+            if droppable:
+                self.bytes -= len(self.frames[index])
+                del self.frames[index], self.stamps[index], self.marks[index]
+                return totals.add(dropped = 1)
+
+        self._kick()  # Nothing in the backlog can go
+
+    def _kick(self) -> None:
+        totals.add(kicked = 1)
+        raise self.BacklogError(self.age())
+
+    def get(self, block: bool = True) -> bytes:
+        with self._cond:
+            self.inflight = None
+            while block and not (self.frames or self.closed):
+                self._cond.wait()
+
+            if not self.frames:
+                return None
+
+            self.inflight = self.stamps.popleft()
+            self.marks.popleft()
+            self.bytes -= len(self.frames[0])
+            return self.frames.popleft()
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self.frames.clear()
+            self.stamps.clear()
+            self.marks.clear()
+            self.bytes = 0
+            self._cond.notify_all()
+
+    # Exceptions
+    class BacklogError(OSError):
+        pass
+
+# Initialization
+totals = QueueTotals()
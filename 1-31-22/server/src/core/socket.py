@@ -2,30 +2,49 @@
 
 # Modules
 import json
+import struct
 import socket
+import asyncio
+from collections import deque
+from threading import Thread, Lock
 from iipython import Hellman
 
-# Plasma Overflow Protection
-try:
-    import psutil
-    def _gen_def_overflow(s) -> int:  # noqa
-        return round((psutil.virtual_memory().available / 2) / len(s.clients))
-
-    _ovfl_needsserver = True
-
-except ImportError:
-    def _gen_def_overflow(s) -> int:
-        return 1048576  # 1mb
-
-    _ovfl_needsserver = False
+from . import framing
+from .memory import memory
+from .iopool import iopool
+from .queue import SendQueue
 
 # Socket class
 class Socket(socket.socket):
-    def __init__(self) -> None:
+    def __init__(self, reuse_port: bool = False) -> None:
         super().__init__(socket.AF_INET, socket.SOCK_STREAM)
 
         # Initialization
         self.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            self.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)  # Workers share the listen port
+
+# Frame class (a packet encoded once, shared by every recipient)
+class Frame(object):
+    __slots__ = ("text", "data", "_raw", "_sealed")
+
+    def __init__(self, data: dict) -> None:
+        self.text = data if isinstance(data, str) else json.dumps(data)
+        self.data = self.text.encode("utf8")
+        self._raw = {}
+        self._sealed = None
+
+    def raw(self, version: int) -> bytes:
+        if version not in self._raw:
+            self._raw[version] = framing.pack(self.data, version)
+
+        return self._raw[version]
+
+    def sealed(self, key) -> bytes:
+        if self._sealed is None or self._sealed[0] is not key:
+            self._sealed = (key, key.seal(self.data))
+
+        return self._sealed[1]
 
 class SocketWrapper(object):
     def __init__(self, socket: socket.socket, server = None) -> None:
@@ -34,53 +53,284 @@ class SocketWrapper(object):
 
         self.server = server
         self.hellman = None
+        self.cipher = None  # Negotiated cipher suite, replaces hellman when set
+        self.group = False  # Accepts frames sealed with the group key
+
+        # Framing
+        self.framing = framing.LEGACY
+        self.decoder = framing.FrameDecoder(size = self.buffer_size)
+
+        # Outbound queue (frames are sealed and queued under one lock, so cipher counters stay in order)
+        self.queue = SendQueue()
+        self.on_error = None
+        self._send_lock = Lock()
+
+        # Downloads being streamed (pulled by the writer whenever the queue is empty)
+        self.downloads = deque()
+
+        # Disk work for this connection
+        self.io = iopool.lane(self._deliver) if server is not None else None
+
+        # Memory accounting
+        self.reserved = 0
+        if server is not None:
+            memory.register()
+            self.reserved = len(self.decoder.data)
+            memory.reserve(self.reserved, force = True)
+
+    def _limit(self, limit: int = None) -> int:
+        return limit or memory.quota()
+
+    def _account(self, size: int, timeout: float = None, callback = None) -> bool:
+        delta = self.decoder.capacity(size) - self.reserved
+        if delta <= 0:
+            memory.release(-delta)
+
+        elif not memory.reserve(delta, timeout = timeout, callback = callback):
+            return False
+
+        self.reserved += delta
+        return True
+
+    def _load(self, data: memoryview, decrypt: bool = True, kind: int = framing.KIND_JSON) -> dict:
+        if self.cipher is not None and decrypt:
+            try:
+                data = self.cipher.open(kind, data)
+                if kind == framing.KIND_CHUNK:
+                    upload, index = framing.CHUNK.unpack_from(data)
+                    return {"type": "f.chunk", "data": {"id": upload.decode("ascii"), "index": index, "data": data[framing.CHUNK.size:]}}
+
+                return json.loads(str(data, "utf8"))
+
+            except (ValueError, struct.error):
+                raise self.SSLError
+
+        elif self.hellman is not None and decrypt:
+            try:
+                return json.loads(self.hellman.decrypt(bytes(data)))
+
+            except ValueError:
+                raise self.SSLError
+
+        return json.loads(str(data, "utf8"))
+
+    def _load_first(self, data: memoryview) -> dict:
+
+        # The handshake has no delimiter, so a packet sent right behind it ends up in the same frame
+        packet, end = json.JSONDecoder().raw_decode(str(data, "latin-1"))
+        if bytes(data[end:]).strip():
+            self.decoder.frames.appendleft((framing.KIND_JSON, data[end:]))
+
+        return packet
+
+    def _next_packet(self, limit: int, decrypt: bool) -> dict:
+        self.decoder.limit = limit
+        frame = self.decoder.next()
+        if frame is not None:
+            try:
+                if not decrypt and self.framing == framing.LEGACY:
+                    return self._load_first(frame[1])
+
+                return self._load(frame[1], decrypt, frame[0])
+
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                return {}  # Frame is complete, so this is a malformed packet
+
+        elif self.framing == framing.LENGTH_PREFIXED:
+            return None
+
+        # Legacy framing (parse the whole buffer until it succeeds)
+        data = self.decoder.readable()
+        if len(data) > limit:
+            self.decoder.consume()
+            raise OverflowError(len(data))
+
+        elif not data:
+            return None
+
+        try:
+            if decrypt:
+                packet = self._load(data, decrypt)
+                self.decoder.consume()
+                return packet
+
+            # Unencrypted packets (the handshake) can be followed by already negotiated (binary) frames
+            text = str(data, "utf8", "surrogateescape")
+            packet, end = json.JSONDecoder().raw_decode(text.lstrip())
+            self.decoder.consume(len(data) - len(text.lstrip()[end:].encode("utf8", "surrogateescape")))
+            return packet
+
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None  # Likely will be fine next pass
+
+        except self.SSLError:
+            self.decoder.consume()
+            raise
+
+    def _seal(self, frame: Frame, key = None) -> bytes:
+        if key is not None and self.group:
+            return frame.sealed(key)
+
+        elif self.cipher is not None:
+            return self.cipher.seal(frame.data)
+
+        elif self.hellman is not None:
+            return framing.pack(self.hellman.encrypt(frame.text), self.framing)
+
+        return frame.raw(self.framing)
+
+    def _seal_chunk(self, download, chunk: memoryview) -> bytes:
+        if self.cipher is not None:
+            return self.cipher.seal(chunk, framing.KIND_CHUNK)
+
+        elif self.hellman is None and self.framing == framing.LENGTH_PREFIXED:
+            return framing.pack(chunk, self.framing, framing.KIND_CHUNK)
+
+        # Hellman (and legacy framing) can only carry JSON
+        index = framing.CHUNK.unpack_from(chunk)[1]
+        return self._seal(Frame({"type": "d.chunk", "data": {"id": download.id, "index": index, "data": chunk[framing.CHUNK.size:].hex()}}))
+
+    def _pull(self):
+        with self._send_lock:
+            if self.queue or not self.downloads:
+                return None  # Queued frames were sealed first, so they have to go out first
+
+            download = self.downloads[0]
+            if download.error is not None or download.done():
+                self.downloads.popleft()
+                download.close()
+                return self._seal(download.end if download.error is None else download.failed)
+
+        # Read without the lock, sending to this client never waits on its disk
+        chunk = self._read(download)
+        if chunk is None:
+            return None
+
+        with self._send_lock:
+            if download not in self.downloads:
+                return None  # Closed during the read
+
+            elif self.queue:
+                download.pending = chunk  # Frames queued during the read go first, the chunk is sealed after them
+                return None
+
+            self.downloads.rotate(-1)  # Concurrent downloads take turns
+            return self._seal_chunk(download, chunk)
+
+    def _read(self, download) -> memoryview:
+        chunk, download.pending = download.pending, None
+        if chunk is not None:
+            return chunk
+
+        try:
+            return download.read()  # The writer has its own thread, so it can wait on the disk
+
+        except (OSError, ValueError) as error:
+            download.error = error  # The next pull tells the client instead of sending the end
+
+    def _close_downloads(self) -> None:
+        with self._send_lock:
+            while self.downloads:
+                self.downloads.popleft().close()
+
+    def set_framing(self, version: int) -> None:
+        self.framing = framing.negotiate(version)
+        self.decoder.switch(self.framing)
+
+    def _fail(self) -> None:
+        self.close()
+        if self.on_error is not None:
+            self.on_error()
+
+    def _deliver(self, func, *args) -> None:
+        return func(*args)
+
+    def start_writer(self) -> None:
+        Thread(target = self.writer, daemon = True).start()
+
+    def writer(self) -> None:
+        while True:
+            frame = self.queue.get(block = not self.downloads)
+            if frame is None:
+                if self.queue.closed:
+                    return self._close_downloads()
+
+                frame = self._pull()
+                if frame is None:
+                    continue
+
+            try:
+                self.sock.sendall(frame)
+
+            except (OSError, ValueError):
+                self._close_downloads()
+                return self._fail()
+
+    def release(self) -> None:
+        if self.server is not None and not self.queue.closed:
+            memory.unregister(self.reserved)
+            self.reserved = 0
 
     def close(self) -> None:
+        self.release()
+        self.queue.close()
         return self.sock.close()
 
     def recv_json(self, limit: int = None, decrypt: bool = True) -> dict:
-        data, limit = b"", (limit or (_gen_def_overflow(self.server if (_ovfl_needsserver and self.server) else None)))
+        limit = self._limit(limit)
         while self.sock:
+            packet = self._next_packet(limit, decrypt)
+            if packet is not None:
+                return packet
+
+            # Stop reading until the memory budget allows the buffer to grow
+            while not self._account(self.buffer_size, timeout = memory.interval):
+                if self.queue.closed:
+                    return None
+
             try:
-                data += self.sock.recv(self.buffer_size)
-                if len(data) > limit:
-                    size = len(data)
-                    del data
-                    raise OverflowError(size)
+                size = self.sock.recv_into(self.decoder.writable(self.buffer_size))
+                if not size:
+                    break
 
             except OSError:
                 # ... close socket & client
                 break
 
-            # Load JSON
-            try:
-                if self.hellman is not None and decrypt:
-                    try:
-                        data = json.loads(self.hellman.decrypt(data))
-
-                    except ValueError:
-                        raise self.SSLError
+            self.decoder.written(size)
 
-                else:
-                    data = json.loads(data.decode("utf8"))
+        return None
 
-                break
+    def poll_json(self, limit: int = None, decrypt: bool = True) -> dict:
+        limit = self._limit(limit)
+        packet = self._next_packet(limit, decrypt)
+        if packet is not None:
+            return packet
 
-            except (json.JSONDecodeError, UnicodeDecodeError):
-                pass  # Likely will be fine next pass
+        # One read of what has already arrived (a selector saw it), never waits for the rest
+        if not self._account(self.buffer_size):
+            raise OverflowError(len(self.decoder))
 
-        if not data:
-            return None
+        size = self.sock.recv_into(self.decoder.writable(self.buffer_size))
+        if not size:
+            raise OSError
 
-        return data
+        self.decoder.written(size)
+        return self._next_packet(limit, decrypt)
 
     def send_json(self, data: dict) -> None:
+        return self.send_frame(Frame(data))
+
+    def send_frame(self, frame: Frame, key = None, download = None, droppable: bool = False) -> None:
         try:
-            if self.hellman is not None:
-                return self.sock.sendall(self.hellman.encrypt(json.dumps(data)) + b"\0x55")
+            with self._send_lock:
+                self.queue.put(self._seal(frame, key), droppable)
+                if download is not None:
+                    self.downloads.append(download)
 
-            raw = json.dumps(data).encode("utf8") + b"\0x55"
-            return self.sock.sendall(raw)
+        except SendQueue.BacklogError:
+            self.close()
+            raise OSError
 
         except Exception:
             raise OSError
@@ -88,3 +338,127 @@ class SocketWrapper(object):
     # Exceptions
     class SSLError(Exception):
         pass
+
+# Async socket wrapper (also acts as the connection's protocol)
+# Transport writes never block, so send_json stays a regular method; the
+# outbound queue only fills up while the transport has paused writing
+class AsyncSocketWrapper(SocketWrapper, asyncio.BufferedProtocol):
+    def __init__(self, server = None) -> None:
+        super().__init__(None, server)
+        self.transport = None
+        self.paused = False
+        self.held = False  # Reading stops while the connection's disk work catches up
+
+        self._waiter = None
+        if self.io is not None:
+            self.io.block = False
+            self.io.on_full, self.io.on_drain = lambda: self.hold(True), lambda: self.hold(False)
+
+    # Protocol callbacks
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+        self.sock = transport.get_extra_info("socket")
+        self.server.accept_async(self, transport.get_extra_info("peername"))
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.decoder.writable(max(sizehint, 0))
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self.decoder.written(nbytes)
+        self._wake()
+        self._check_budget()
+
+    def _check_budget(self) -> None:
+        if self.transport is None or self.transport.is_closing():
+            return
+
+        elif self.held:
+            return self.transport.pause_reading()
+
+        # Stop reading until the memory budget allows the buffer to grow
+        loop = self.server.loop
+        if self._account(0, callback = lambda: loop.call_soon_threadsafe(self._check_budget)):
+            self.transport.resume_reading()
+
+        else:
+            self.transport.pause_reading()
+
+    def connection_lost(self, exc: Exception) -> None:
+        self.sock = None
+        self.release()
+        self.queue.close()
+        self._close_downloads()
+        self._wake()
+
+    def pause_writing(self) -> None:
+        self.paused = True
+
+    def resume_writing(self) -> None:
+        self.paused = False
+        self.writer()
+
+    def hold(self, held: bool) -> None:
+        self.held = held
+        self._check_budget()
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    # Socket methods
+    def _deliver(self, func, *args) -> None:
+        self.server.loop.call_soon_threadsafe(func, *args)
+
+    def _read(self, download) -> memoryview:
+        chunk, download.pending = download.pending, None
+        if chunk is None and not download.reading:
+            download.reading = True
+            self.io.submit(download.read, callback = lambda chunk, error: self._on_read(download, chunk, error), force = True)
+
+        return chunk
+
+    def _on_read(self, download, chunk: memoryview, error: Exception) -> None:
+        download.reading = False
+        download.pending, download.error = chunk, error  # A failed read ends the download on the next pull, as in thread mode
+        if self.transport is not None and not self.transport.is_closing():
+            self.writer()
+
+    def start_writer(self) -> None:
+        pass  # The transport drives the writer through pause/resume_writing
+
+    def writer(self) -> None:
+        while not self.paused:
+            frame = self.queue.get(block = False)
+            if frame is None:
+                frame = self._pull()  # Chunks are read as the transport drains, not all at once
+                if frame is None:
+                    return
+
+            self.transport.write(frame)
+
+    def close(self) -> None:
+        self.release()
+        self.queue.close()
+        self._close_downloads()
+        if self.transport is not None:
+            self.transport.close()
+
+    async def recv_json(self, limit: int = None, decrypt: bool = True) -> dict:
+        limit = self._limit(limit)
+        while True:
+            packet = self._next_packet(limit, decrypt)
+            if packet is not None:
+                return packet
+
+            elif self.sock is None:
+                return None
+
+            self._waiter = asyncio.get_running_loop().create_future()
+            await self._waiter
+
+    def send_frame(self, frame: Frame, key = None, download = None, droppable: bool = False) -> None:
+        if self.transport is None or self.transport.is_closing():
+            raise OSError
+
+        super().send_frame(frame, key, download, droppable)
+        return self.writer()
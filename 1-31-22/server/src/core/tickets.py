@@ -0,0 +1,49 @@
+# Copyright 2021 iiPython
+
+# Modules
+import os
+import json
+import time
+
+from . import session
+from .config import config
+from .session import AES
+
+# Configuration
+_RESUME_CONFIG   = config.get("resume") or {}
+_RESUME_LIFETIME = _RESUME_CONFIG.get("lifetime", 3600)  # in seconds (0 to disable resumption)
+_RESUME_KEY      = _RESUME_CONFIG.get("key")             # hex, keeps tickets valid across restarts
+
+# Ticket issuer class
+# Tickets are the session secret and its expiry sealed with a key only the
+# server knows, so nothing is stored per client and every worker (they all
+# inherit the key) can open a ticket another one issued
+class TicketIssuer(object):
+    def __init__(self, key: bytes = None, lifetime: int = _RESUME_LIFETIME) -> None:
+        self.key = key or os.urandom(32)
+        self.lifetime = lifetime
+
+    def enabled(self) -> bool:
+        return session.available() and self.lifetime > 0
+
+    def issue(self) -> dict:
+        secret, nonce = os.urandom(32), os.urandom(12)
+        ciphertext, tag = AES.new(self.key, AES.MODE_GCM, nonce = nonce).encrypt_and_digest(
+            json.dumps({"secret": secret.hex(), "expires": time.time() + self.lifetime}).encode("utf8")
+        )
+        return {"ticket": (nonce + tag + ciphertext).hex(), "secret": secret.hex(), "lifetime": self.lifetime}
+
+    def open(self, ticket: str) -> bytes:
+        try:
+            ticket = bytes.fromhex(ticket)
+            data = json.loads(AES.new(self.key, AES.MODE_GCM, nonce = ticket[:12]).decrypt_and_verify(ticket[28:], ticket[12:28]))
+            if data["expires"] < time.time():
+                return None
+
+            return bytes.fromhex(data["secret"])
+
+        except (TypeError, ValueError, KeyError):
+            return None  # Forged, corrupted or sealed with another key
+
+# Initialization
+tickets = TicketIssuer(bytes.fromhex(_RESUME_KEY) if _RESUME_KEY else None)
@@ -0,0 +1,105 @@
+# Copyright 2021 iiPython
+
+# Modules
+from threading import RLock
+from collections import deque, OrderedDict
+
+from ..core.config import config
+
+# Configuration
+_CHANNEL_CONFIG  = config.get("channels") or {}
+_CHANNEL_LIMIT   = _CHANNEL_CONFIG.get("limit", 256)   # Channels kept in memory
+_CHANNEL_HISTORY = _CHANNEL_CONFIG.get("history", 50)  # Messages kept per channel
+
+# Channel
+class Channel(object):
+    __slots__ = ("name", "members", "history", "_snapshot")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.members = set()
+        self.history = deque(maxlen = _CHANNEL_HISTORY)
+        self._snapshot = ()
+
+# Channel registry
+# Each channel keeps its own subscriber set, so a channel message only costs
+# as much as the channel has members; empty channels (and their history) are
+# kept until the limit is hit, then evicted least recently used first
+class ChannelRegistry(object):
+    def __init__(self, limit: int = _CHANNEL_LIMIT) -> None:
+        self.lock = RLock()
+        self.limit = limit
+
+        self._channels = OrderedDict()  # name -> channel, least recently used first
+        self._joined = {}  # client -> set of channel names
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._channels
+
+    def _open(self, name: str) -> Channel:
+        channel = self._channels.get(name)
+        if channel is None:
+            if len(self._channels) >= self.limit:
+                for old in self._channels.values():
+                    if not old.members:
+                        del self._channels[old.name]
+                        break
+
+                else:
+                    return None  # Every channel is in use
+
+            channel = self._channels[name] = Channel(name)
+
+        self._channels.move_to_end(name)
+        return channel
+
+    def _update(self, channel: Channel) -> None:
+        channel._snapshot = tuple(channel.members)
+
+    # Membership
+    def join(self, client, name: str) -> list:
+        with self.lock:
+            channel = self._open(name)
+            if channel is None:
+                return None
+
+            if client not in channel.members:
+                channel.members.add(client)
+                self._joined.setdefault(client, set()).add(name)
+                self._update(channel)
+
+            return list(channel.history)
+
+    def leave(self, client, name: str) -> bool:
+        with self.lock:
+            channel = self._channels.get(name)
+            if channel is None or client not in channel.members:
+                return False
+
+            channel.members.remove(client)
+            self._joined[client].discard(name)
+            self._update(channel)
+            return True
+
+    def drop(self, client) -> None:
+        with self.lock:
+            for name in self._joined.pop(client, ()):
+                channel = self._channels[name]
+                channel.members.discard(client)
+                self._update(channel)
+
+    def joined(self, client) -> set:
+        return self._joined.get(client, set())
+
+    # Messages
+    def record(self, name: str, packet: dict) -> tuple:
+        with self.lock:
+            channel = self._open(name)
+            if channel is None:
+                return ()
+
+            channel.history.append(packet)
+            return channel._snapshot
@@ -3,78 +3,164 @@
 # Modules
 import os
 import time
-import random
-import string
 import socket
+import asyncio
 import hashlib
 from typing import Tuple
-from iipython import Hellman
 from datetime import datetime
+from ..core import framing, session
 from ..core.config import config
-from ..core.socket import SocketWrapper
+from ..core.tickets import tickets
+from ..core.session import SessionCipher
+from ..core.handshake import keys, handshakes, _HANDSHAKE_TIMEOUT
+from ..core.socket import SocketWrapper, AsyncSocketWrapper, Frame
+from .uploads import UploadRegistry
+from .downloads import Download
 
 # Configuration
 _CONTENT_LIMIT = config.get("limits")["content"]
 _PACKET_LIMIT  = int(config.get("limits")["packet"] * 1000) if "packet" in config.get("limits") else None  # in Kilobytes
-_FILE_DIR      = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "files")
-
-# Clear up files
-for file in os.listdir(_FILE_DIR):
-    os.remove(os.path.join(_FILE_DIR, file))
 
 # Client class
 class Client(object):
     def __init__(self, server, data: tuple = Tuple[Tuple[str, int], socket.socket]) -> None:
         self.srv = server
         self.conn, self.addr = data
-        self.sock = SocketWrapper(self.conn, self.srv)
+        self.sock = self.conn if isinstance(self.conn, SocketWrapper) else SocketWrapper(self.conn, self.srv)
+        self.sock.on_error = self.shutdown
 
         # Attributes
         self.authed   =   False
+        self.roster   =   False  # Receives roster deltas instead of the user list
         self.attr     =   {
             "uid": None,  # User ID
             "name": None  # Username
         }
 
-        # Hellman (SSL)
-        self.hellman = Hellman(
-            random.randint(1000, 9999),
-            random.randint(10 ** 15, 15 ** 15)
-        )
+        # Hellman (SSL), taken from the pool of pre-generated key pairs
+        self.hellman = keys.take()
+        self.cipher = None  # Session cipher, if the client picked a cipher suite
+        self.nonce = os.urandom(16)
+        self.resume = False  # Gets a resumption ticket once connected
+        self.exchange = None  # (suite, nonce) while waiting on the public key that follows a turned down ticket
+        self.claiming = None  # (user, data) of a u.connect waiting on the worker bus (async mode)
 
-    def handshake(self) -> None:
+    def handshake_packet(self) -> dict:
         hm = self.hellman
+        return {"type": "s.handshake", "data": {
+            "base": hm.base, "modu": hm.modu, "pub": hm.pub_key, "framing": framing.SUPPORTED,
+            "group": self.srv.group is not None, "suites": session.SUITES, "resume": tickets.enabled(), "nonce": self.nonce.hex()
+        }}
+
+    def complete_handshake(self, data: dict) -> bool:
+        data = data["data"]
+        if self.exchange is not None:
+            return self.exchange_keys(data["pub"], *self.exchange)  # The public key that followed a turned down ticket
+
+        self.sock.set_framing(data.get("framing"))
+
+        # Group key and cipher suite frames are binary, so only length prefixed framing can carry them
+        binary = self.sock.framing == framing.LENGTH_PREFIXED
+        suite = data.get("suite") if binary and data.get("suite") in session.SUITES else None
+        self.sock.group = self.srv.group is not None and data.get("group") is True and binary
+        self.resume = tickets.enabled() and data.get("resume") is True and suite is not None
+
+        # Resumed sessions derive their keys from the ticket instead of running the key exchange
+        nonce = bytes.fromhex(data["nonce"]) if suite is not None else None
+        if self.resume and "ticket" in data:
+            secret = tickets.open(data["ticket"])
+            self.sock.send_json({"type": "s.resumed", "data": {"resumed": secret is not None}})
+            if secret is not None:
+                keys.put(self.hellman)  # Its private key never took part in an exchange, so the next connection can have it
+                self.hellman, self.cipher = None, SessionCipher.derive(secret, self.nonce, nonce, server = True, suite = suite)
+                return True
+
+            elif "pub" not in data:
+                self.exchange = (suite, nonce)
+                return None  # Clients holding a ticket only send their public key once it's turned down
+
+        return self.exchange_keys(data["pub"], suite, nonce)
+
+    def exchange_keys(self, pub: int, suite: str, nonce: bytes) -> bool:
+        self.exchange = None
+        self.hellman.generate_shared(pub)
+        if suite is not None:
+            self.cipher = SessionCipher.derive(str(self.hellman.shared_key).encode("utf8"), self.nonce, nonce, server = True, suite = suite)
+
+        return False
+
+    def start_handshake(self) -> None:
+
+        # Send base, modulo, + pub key (the handshake pool's selector waits on the reply)
+        self.sock.start_writer()
+        self.sock.sock.settimeout(_HANDSHAKE_TIMEOUT)  # Only read once data is there, this is a backstop
+        self.sock.send_json(self.handshake_packet())
 
-        # Send base, modulo, + pub key
+    def read_handshake(self) -> dict:
+        return self.sock.poll_json(limit = _PACKET_LIMIT, decrypt = False)
+
+    def handshake(self, packet: dict) -> None:
+
+        # The reply has fully arrived, so this only runs the key exchange (the socket can be closed by the writer at any point)
         try:
-            tm = self.sock.sock.gettimeout()
-            self.sock.sock.settimeout(2)
+            resumed = self.complete_handshake(packet)
+            if resumed is None:
+                return handshakes.watch(self)  # Back to the selector for the public key
 
-            self.sock.send_json({"type": "s.handshake", "data": {"base": hm.base, "modu": hm.modu, "pub": hm.pub_key}})
-            client_pub = self.sock.recv_json(limit = _PACKET_LIMIT, decrypt = False)["data"]["pub"]
-            hm.generate_shared(client_pub)
+            self.sock.sock.settimeout(None)
 
         except Exception:
-            self.print(f"[red]{self.addr} failed to handshake properly.")
-            return self.shutdown()
+            return self.handshake_failed()
 
-        self.sock.sock.settimeout(tm)
+        handshakes.finish(True, resumed, self.addr[0])
+        return True
+
+    def handshake_failed(self) -> None:
+        handshakes.finish(False, source = self.addr[0])
+        self.print(f"[red]{self.addr} failed to handshake properly.")
+        return self.shutdown()
+
+    async def handshake_async(self) -> None:
+        try:
+            self.sock.send_json(self.handshake_packet())
+            resumed = self.complete_handshake(await asyncio.wait_for(self.sock.recv_json(limit = _PACKET_LIMIT, decrypt = False), _HANDSHAKE_TIMEOUT))
+            if resumed is None:
+                resumed = self.complete_handshake(await asyncio.wait_for(self.sock.recv_json(limit = _PACKET_LIMIT, decrypt = False), _HANDSHAKE_TIMEOUT))
+
+        except Exception:
+            return self.handshake_failed()
+
+        handshakes.finish(True, resumed, self.addr[0])
         return True
 
     def shutdown(self) -> None:
+        handshakes.cancel(self)  # Never leave a closed socket in the handshake selector
+        with self.srv.clients.lock:
+            if self.srv.clients.remove(self):
+                if self.sock.group:
+                    self.srv.rotate_group()  # The key this client holds must not open new broadcasts, not even its own leave
+
+                self.srv.broadcast_roster("g.roster_remove", self)
+
+        self.srv.channels.drop(self)
+        if self.sock.io is not None:
+            self.sock.io.submit(self.srv.uploads.detach, (self.attr.get("uid"),), force = True)  # After any chunk still being written
         self.attr = {}
         self.authed = False
-
         self.sock.close()
-        try:
-            self.srv.clients.remove(self)
-
-        except ValueError:
-            pass
 
     def to_dict(self) -> dict:
         return self.attr
 
+    def queue_depth(self) -> int:
+        return len(self.sock.queue)
+
+    def buffer_peak(self) -> int:
+        return self.sock.decoder.peak
+
+    def guild(self) -> dict:
+        return self.srv.to_dict(users = not self.roster) | {"packet_limit": _PACKET_LIMIT}
+
     def pack_json(self, **kwargs) -> dict:
         return {
             "type": kwargs.get("type", "m.msg"),
@@ -82,13 +168,12 @@ class Client(object):
                 "author": kwargs.get("author", {"uid": "system", "name": "System"}),
                 "content": kwargs["content"],
                 "timestamp": time.time()
-            },
-            "guild": self.srv.to_dict() | {"packet_limit": _PACKET_LIMIT}
+            }
         }
 
     def send(self, **kwargs) -> None:
         try:
-            return self.sock.send_json(self.pack_json(**kwargs))
+            return self.sock.send_json(self.pack_json(**kwargs) | {"guild": self.guild()})
 
         except OSError:
             return self.shutdown()
@@ -96,156 +181,364 @@ class Client(object):
     def print(self, *args, **kwargs) -> None:
         return self.srv.console.print(*args, **kwargs)
 
+    # Disk work (runs on the connection's I/O lane, then comes back here)
+    def run_io(self, func, *args, then = None) -> None:
+        self.sock.io.submit(func, args, lambda result, error: self.io_done(result, error, then))
+
+    def io_done(self, result, error: Exception, then) -> None:
+        if error is None:
+            return then(result) if then is not None else None
+
+        elif isinstance(error, UploadRegistry.UploadError):
+            return self.send(type = "e.file", content = str(error))
+
+        self.print(f"[red]File operation failed for {self.addr}: {error!r}")
+        self.send(type = "e.server", content = "Server error has occured, try your request again later.")
+
+    def open_download(self, id: str, offset: int = 0, length: int = None) -> tuple:
+        entry = self.srv.files.get(id)
+        if entry is None:
+            return None
+
+        try:
+            download = Download(entry.id, self.srv.files.path(entry), offset = offset, length = length)
+
+        except FileNotFoundError:
+            return None  # Evicted since the lookup
+
+        self.srv.files.touch(entry)
+        return entry, download
+
+    def start_download(self, result: tuple) -> None:
+        if result is None:
+            return self.send(type = "d.invalid_id", content = "File ID is invalid.")
+
+        # Streamed in chunks by the connection's writer, never read whole
+        entry, download = result
+        download.end = Frame(self.pack_json(type = "d.end", content = {"id": entry.id}) | {"guild": self.guild()})
+        download.failed = Frame(self.pack_json(type = "d.end", content = {"id": entry.id, "error": "The server couldn't read the file."}) | {"guild": self.guild()})
+        begin = {
+            "id": entry.id, "name": entry.name, "size": download.total, "hash": entry.hash,
+            "offset": download.start, "length": download.size, "chunk": download.chunk
+        }
+        try:
+            self.sock.send_frame(Frame(self.pack_json(type = "d.begin", content = begin) | {"guild": self.guild()}), download = download)
+
+        except OSError:
+            download.close()
+            self.shutdown()
+
+    def upload_done(self, upload, author: dict) -> None:
+        self.send(type = "f.done", content = {"id": upload.id})
+        self.srv.broadcast(self.pack_json(author = author, content = {"name": upload.name, "id": upload.id}, type = "m.bin"))
+
     def generate_uid(self, name: str) -> str:
         return hashlib.sha512(f"{name}-{self.addr[0]}".encode()).hexdigest()
 
-    def handle(self) -> None:
-        if self.handshake() is None:
-            return
+    def recv_error(self, err: Exception) -> None:
+        if isinstance(err, OverflowError):
+            self.print(f"[red]Ignored data from {self.attr['uid']} - got {int(float(str(err)))}b; limit is {_PACKET_LIMIT}b")
+            return self.send(type = "e.overflow", content = f"Packet limit is {_PACKET_LIMIT} bytes!")
+
+        return self.send(type = "e.ssl", content = "Something went wrong while decrypting your request.")
 
-        self.sock.hellman = self.hellman
+    def handle(self) -> None:
+        self.sock.hellman, self.sock.cipher = self.hellman, self.cipher  # The handshake already ran on the handshake pool
         while True:
             try:
                 data = self.sock.recv_json(limit = _PACKET_LIMIT)
                 if data is None:
-                    return self.shutdown()
+                    break
 
-            except OverflowError as err:
-                self.print(f"[red]Ignored data from {self.attr['uid']} - got {int(float(str(err)))}b; limit is {_PACKET_LIMIT}b")
-                self.send(type = "e.overflow", content = f"Packet limit is {_PACKET_LIMIT} bytes!")
+            except (OverflowError, self.sock.SSLError) as err:
+                self.recv_error(err)
                 continue
 
-            except self.sock.SSLError:
-                self.send(type = "e.ssl", content = "Something went wrong while decrypting your request.")
-                continue
+            if not self.dispatch(data):
+                break
+
+        # Shutdown client
+        self.shutdown()
 
-            # Check data
+    async def handle_async(self) -> None:
+        if await self.handshake_async() is None:
+            return
+
+        self.sock.hellman, self.sock.cipher = self.hellman, self.cipher
+        while True:
             try:
-                dtype, data = data["type"], (data["data"] if "data" in data else {})
-                if not isinstance(data, dict):
-                    raise ValueError
+                data = await self.sock.recv_json(limit = _PACKET_LIMIT)
+                if data is None:
+                    break
 
-                elif "." not in dtype:
-                    raise ValueError
+            except (OverflowError, self.sock.SSLError) as err:
+                self.recv_error(err)
+                continue
 
-                elif dtype.count(".") > 1:
-                    raise ValueError
+            if not self.dispatch(data):
+                break
 
-                type_base = dtype.split(".")[0]
-                if not type_base.strip():
-                    raise ValueError
+            # u.connect with workers, the hub's answer resolves a future
+            if self.claiming is not None:
+                (user, data), self.claiming = self.claiming, None
+                self.join(user, data, await self.srv.bus.claim_async(user))
 
-                dtype = dtype.split(".")[1]
+        # Shutdown client
+        self.shutdown()
 
-            except Exception:
-                self.send(type = "e.parse", content = "Invalid type/data or field(s) missing.")
-                continue
+    def join(self, user: dict, data: dict, claimed: bool) -> None:
+        bus = self.srv.bus
+        if not claimed:
+            self.send(type = "e.taken", content = "A user with that name already exists.")
+            return
 
-            # Handle action(s)
-            if type_base == "u":
-                if dtype == "connect":
-                    if self.authed:
-                        self.send(type = "e.unexpected", content = "Client is already authenticated.")
-                        continue
-
-                    # Check data
-                    name = data.get("name", "")
-                    if not (name.strip() and " " not in name and len(name) <= 16 and ":" not in name):
-                        self.send(type = "e.parse", content = "Invalid name or field missing.")
-                        continue
-
-                    elif name.lower() in [u.attr["name"].lower() for u in self.srv.clients if u.attr.get("name")]:
-                        self.send(type = "e.taken", content = "A user with that name already exists.")
-                        continue
-
-                    # Attributes
-                    self.attr = {"uid": self.generate_uid(name), "name": name}
-                    self.authed = True
-
-                    # Welcome message
-                    now = datetime.utcnow().strftime("%H:%M")
-                    self.send(content = f"[cyan]Welcome to {config.get('name')}! [lred]{now} UTC[reset]")
-                    self.srv.broadcast(self.pack_json(
-                        content = f"[lgreen]{self.attr['name']}[/lgreen] has [green]joined[/green] the server.",
-                        type = "u.join"
-                    ))
+        # The bus claim already ran (never wait on it while holding the lock)
+        with self.srv.clients.lock:
+            if not self.srv.clients.claim(self, user["name"], user["uid"]):
+                if bus is not None:
+                    bus.announce("roster_remove", user)
 
-                elif dtype == "leave":
-                    self.srv.broadcast(self.pack_json(
-                        content = f"[lgreen]{self.attr['name']}[/lgreen] has [red]left[/red] the server.",
-                        type = "u.leave"
-                    ))
-                    break
+                self.send(type = "e.taken", content = "A user with that name already exists.")
+                return
 
-            # Authenticated action(s)
-            elif self.authed:
-                if type_base == "m":
-                    if dtype == "msg":
-                        try:
-                            message = str(data["content"]).strip("\b\r")
-                            if not message.strip():
-                                raise ValueError
-
-                            elif len(message) > _CONTENT_LIMIT:
-                                raise OverflowError
-
-                            self.srv.broadcast(self.pack_json(author = self.to_dict(), content = message))
-                            continue
-
-                        except Exception as err:
-                            except_map = {
-                                ValueError: {"type": "e.missing", "content": "Message missing."},
-                                OverflowError: {"type": "e.overflow", "content": f"Message limit is {_CONTENT_LIMIT} char(s)."}
-                            }
-                            if type(err) in except_map:
-                                self.send(**except_map[type(err)])
-                                continue
-
-                            self.send(type = "e.server", content = "Server error has occured, try your request again later.")
-                            raise err
-
-                    elif dtype == "bin":
-                        try:
-                            message, fileid = bytes.fromhex(data["content"]), "".join(random.choice(string.ascii_letters) for _ in range(8))
-                            if "/" in data["name"] or "\\" in data["name"]:
-                                raise ValueError
-
-                            filepath = os.path.join(_FILE_DIR, fileid + "_" + data["name"])
-                            with open(filepath, "wb") as file:
-                                file.write(message)
-
-                            self.srv.broadcast(self.pack_json(author = self.to_dict(), content = {"name": data["name"], "id": fileid}, type = "m.bin"))
-                            continue
-
-                        except Exception as err:
-                            except_map = {
-                                IndexError: {"type": "e.missing", "content": "Content or filename is missing."},
-                                ValueError: {"type": "e.invalid", "content": "Provided filename is invalid."}
-                            }
-                            if type(err) in except_map:
-                                self.send(**except_map[type(err)])
-                                continue
-
-                            self.send(type = "e.server", content = "Server error has occured, try your request again later.")
-                            raise err
-
-                elif type_base == "d":
-                    if dtype == "down":
-                        try:
-                            fileid = data["id"]
-                            try:
-                                filename = [_ for _ in os.listdir(_FILE_DIR) if _.split("_")[0] == fileid][0]
-
-                            except IndexError:
-                                self.send(type = "d.invalid_id", content = "File ID is invalid.")
-                                continue
-
-                            with open(os.path.join(_FILE_DIR, filename), "rb") as file:
-                                self.send(type = "d.content", content = {"data": file.read().hex(), "name": "_".join(filename.split("_")[1:])})
-
-                        except IndexError:
-                            self.send(type = "e.missing", content = "File ID is missing.")
-                            continue
+            # Group key (sent before anything is sealed with it)
+            if self.sock.group:
+                self.send(type = "s.key", content = self.srv.group.to_dict())
 
-        # Shutdown client
-        self.shutdown()
+            # Resumption ticket (a fresh one on every connect, resumed or not)
+            if self.resume:
+                self.send(type = "s.ticket", content = tickets.issue())
+
+            # Attributes
+            self.attr = user
+            self.authed = True
+            self.roster = data.get("roster") is True
+
+            # Roster snapshot (deltas follow from here on)
+            if self.roster:
+                self.send(type = "g.roster", content = self.srv.roster())
+
+            self.srv.broadcast_roster("g.roster_add", self)
+
+        # Welcome message
+        now = datetime.utcnow().strftime("%H:%M")
+        self.send(content = f"[cyan]Welcome to {config.get('name')}! [lred]{now} UTC[reset]")
+        self.srv.broadcast(self.pack_json(
+            content = f"[lgreen]{self.attr['name']}[/lgreen] has [green]joined[/green] the server.",
+            type = "u.join"
+        ))
+
+    def dispatch(self, data: dict) -> bool:
+
+        # Check data
+        try:
+            dtype, data = data["type"], (data["data"] if "data" in data else {})
+            if not isinstance(data, dict):
+                raise ValueError
+
+            elif "." not in dtype:
+                raise ValueError
+
+            elif dtype.count(".") > 1:
+                raise ValueError
+
+            type_base = dtype.split(".")[0]
+            if not type_base.strip():
+                raise ValueError
+
+            dtype = dtype.split(".")[1]
+
+        except Exception:
+            self.send(type = "e.parse", content = "Invalid type/data or field(s) missing.")
+            return True
+
+        # Handle action(s)
+        if type_base == "u":
+            if dtype == "connect":
+                if self.authed:
+                    self.send(type = "e.unexpected", content = "Client is already authenticated.")
+                    return True
+
+                # Check data
+                name = data.get("name", "")
+                if not (name.strip() and " " not in name and len(name) <= 16 and ":" not in name):
+                    self.send(type = "e.parse", content = "Invalid name or field missing.")
+                    return True
+
+                uid = self.generate_uid(name)
+                user = {"uid": uid, "name": name}
+
+                # Names are unique across every worker; in async mode handle_async
+                # awaits the claim so the event loop never blocks on the bus
+                if self.srv.bus is not None and isinstance(self.sock, AsyncSocketWrapper):
+                    self.claiming = (user, data)
+                    return True
+
+                self.join(user, data, self.srv.bus is None or self.srv.bus.claim(user))
+
+            elif dtype == "leave":
+                self.srv.broadcast(self.pack_json(
+                    content = f"[lgreen]{self.attr['name']}[/lgreen] has [red]left[/red] the server.",
+                    type = "u.leave"
+                ))
+                return False
+
+        # Authenticated action(s)
+        elif self.authed:
+            if type_base == "m":
+                if dtype == "msg":
+                    try:
+                        message = str(data["content"]).strip("\b\r")
+                        if not message.strip():
+                            raise ValueError
+
+                        elif len(message) > _CONTENT_LIMIT:
+                            raise OverflowError
+
+                        # Channel messages only go to the channel's members
+                        packet, channel = self.pack_json(author = self.to_dict(), content = message), data.get("channel")
+                        if channel is not None:
+                            channel = str(channel).casefold()
+                            if channel not in self.srv.channels.joined(self):
+                                self.send(type = "e.channel", content = "Join the channel before sending to it.")
+                                return True
+
+                            packet["data"]["channel"] = channel
+
+                        self.srv.broadcast(packet, channel = channel)
+                        return True
+
+                    except Exception as err:
+                        except_map = {
+                            ValueError: {"type": "e.missing", "content": "Message missing."},
+                            OverflowError: {"type": "e.overflow", "content": f"Message limit is {_CONTENT_LIMIT} char(s)."}
+                        }
+                        if type(err) in except_map:
+                            self.send(**except_map[type(err)])
+                            return True
+
+                        self.send(type = "e.server", content = "Server error has occured, try your request again later.")
+                        raise err
+
+                elif dtype == "bin":
+                    try:
+                        message, name, author = bytes.fromhex(data["content"]), data["name"], self.to_dict()
+                        if "/" in name or "\\" in name:
+                            raise ValueError
+
+                        elif not self.srv.files.fits(author["uid"], len(message)):
+                            self.send(type = "e.file", content = f"Not enough room, you have {self.srv.files.usage(author['uid'])} bytes stored already.")
+                            return True
+
+                        self.run_io(
+                            lambda: self.srv.files.write(self.srv.files.generate_id(), name, message, author["uid"]),
+                            then = lambda entry: self.srv.broadcast(self.pack_json(author = author, content = {"name": name, "id": entry.id}, type = "m.bin"))
+                        )
+                        return True
+
+                    except Exception as err:
+                        except_map = {
+                            IndexError: {"type": "e.missing", "content": "Content or filename is missing."},
+                            ValueError: {"type": "e.invalid", "content": "Provided filename is invalid."}
+                        }
+                        if type(err) in except_map:
+                            self.send(**except_map[type(err)])
+                            return True
+
+                        self.send(type = "e.server", content = "Server error has occured, try your request again later.")
+                        raise err
+
+            elif type_base == "g":
+                if dtype == "resync":
+                    self.send(type = "g.roster", content = self.srv.roster())
+
+            elif type_base == "c":
+                name = data.get("name")
+                if not (isinstance(name, str) and name.strip() and " " not in name and len(name) <= 32):
+                    self.send(type = "e.parse", content = "Invalid channel name or field missing.")
+                    return True
+
+                name = name.casefold()
+                if dtype == "join":
+                    history = self.srv.channels.join(self, name)
+                    if history is None:
+                        self.send(type = "e.channel", content = "The server has no room for more channels.")
+                        return True
+
+                    self.send(type = "c.joined", content = {"channel": name, "history": history})
+
+                elif dtype == "leave":
+                    if not self.srv.channels.leave(self, name):
+                        self.send(type = "e.channel", content = "You are not in that channel.")
+                        return True
+
+                    self.send(type = "c.left", content = {"channel": name})
+
+            elif type_base == "f":
+                try:
+                    uploads, uid = self.srv.uploads, self.attr["uid"]
+                    if dtype == "begin":
+                        name = str(data["name"])
+                        if not name.strip() or "/" in name or "\\" in name:
+                            raise ValueError
+
+                        # Uploads resume from the last chunk that made it to disk
+                        if "id" in data:
+                            job, args = uploads.resume, (uid, str(data["id"]))
+
+                        else:
+                            chunk = min(uploads.chunk, (_PACKET_LIMIT - 1024) // 2) if _PACKET_LIMIT else None  # Hex chunks must fit a packet
+                            job, args = uploads.begin, (uid, name, int(data["size"]), chunk)
+
+                        self.run_io(job, *args, then = lambda upload: self.send(type = "f.ready", content = {"id": upload.id, "next": upload.next(), "chunk": upload.chunk}))
+
+                    elif dtype == "chunk":
+                        upload_id, index, content = str(data["id"]), int(data["index"]), data["data"]
+                        if isinstance(content, str):
+                            content = bytes.fromhex(content)
+
+                        elif isinstance(content, memoryview):
+                            content = bytes(content)  # Binary chunks are views of a buffer the next read reuses
+
+                        else:
+                            raise ValueError
+
+                        self.run_io(
+                            lambda: uploads.write(uploads.get(uid, upload_id), index, content),
+                            then = lambda _: self.send(type = "f.ack", content = {"id": upload_id, "index": index})
+                        )
+
+                    elif dtype == "end":
+                        upload_id, author = str(data["id"]), self.to_dict()
+                        self.run_io(lambda: uploads.finish(uploads.get(uid, upload_id)), then = lambda upload: self.upload_done(upload, author))
+
+                except Exception as err:
+                    except_map = {
+                        KeyError: {"type": "e.missing", "content": "Upload ID, index, data, size or filename is missing."},
+                        ValueError: {"type": "e.invalid", "content": "Provided filename, size or data is invalid."}
+                    }
+                    if type(err) in except_map:
+                        self.send(**except_map[type(err)])
+                        return True
+
+                    self.send(type = "e.server", content = "Server error has occured, try your request again later.")
+                    raise err
+
+            elif type_base == "d":
+                if dtype == "down":
+                    try:
+                        offset, length = data.get("offset", 0), data.get("length")
+                        if not isinstance(offset, int) or offset < 0 or not (length is None or isinstance(length, int) and length >= 0):
+                            raise ValueError
+
+                        self.run_io(self.open_download, str(data["id"]), offset, length, then = self.start_download)
+
+                    except KeyError:
+                        self.send(type = "e.missing", content = "File ID is missing.")
+                        return True
+
+                    except ValueError:
+                        self.send(type = "e.invalid", content = "Offset and length must be whole numbers, zero or more.")
+                        return True
+
+        return True
@@ -0,0 +1,60 @@
+# Copyright 2021 iiPython
+
+# Modules
+import os
+
+from ..core import framing
+from .uploads import _FILE_CHUNK
+
+# Download class
+# A file being streamed to one connection; the connection's writer pulls the
+# next chunk whenever its queue runs empty, so chat traffic goes first and
+# every chunk is read into the same buffer (with the chunk header in front);
+# a download can cover just part of the file, chunk indexes start at its offset
+class Download(object):
+    def __init__(self, id: str, path: str, chunk: int = _FILE_CHUNK, offset: int = 0, length: int = None) -> None:
+        self.id = id
+        self.chunk = chunk
+        self.file = open(path, "rb")
+        self.total = os.fstat(self.file.fileno()).st_size
+
+        # Range (clamped to the file)
+        self.start = min(offset, self.total)
+        self.stop = self.total if length is None else min(self.start + length, self.total)
+        self.size = self.stop - self.start
+
+        self.index = 0
+        self.offset = self.start
+        self.end = None  # Frame sent once the last chunk is out
+        self.failed = None  # Frame sent instead if the file can't be read
+        self.error = None
+
+        # Async mode reads a chunk ahead on the I/O pool
+        self.pending = None
+        self.reading = False
+
+        self._buffer = None  # Made on the first read
+
+    def done(self) -> bool:
+        return self.offset >= self.stop and self.pending is None and not self.reading
+
+    def advance(self) -> tuple:
+        index, offset, size = self.index, self.offset, min(self.chunk, self.stop - self.offset)
+        self.index += 1
+        self.offset += size
+        return index, offset, size
+
+    def read(self) -> memoryview:
+        if self._buffer is None:
+            self._buffer = bytearray(framing.CHUNK.size + self.chunk)
+
+        index, offset, size = self.advance()
+        view = memoryview(self._buffer)
+        framing.CHUNK.pack_into(view, 0, self.id.encode("ascii"), index)
+
+        self.file.seek(offset)
+        size = self.file.readinto(view[framing.CHUNK.size:framing.CHUNK.size + size])
+        return view[:framing.CHUNK.size + size]
+
+    def close(self) -> None:
+        self.file.close()
@@ -0,0 +1,263 @@
+# Copyright 2021 iiPython
+
+# Modules
+import os
+import json
+import time
+import heapq
+import random
+import string
+import hashlib
+from collections import OrderedDict
+from threading import Thread, Lock, Event
+
+from ..core.config import config
+
+# Configuration
+_FILE_CONFIG     = config.get("files") or {}
+_FILE_QUOTA      = int(_FILE_CONFIG.get("quota", 1024) * 1048576)      # in Megabytes (0 for no limit)
+_FILE_USER_QUOTA = int(_FILE_CONFIG.get("user_quota", 256) * 1048576)  # in Megabytes (0 for no limit)
+_FILE_TTL        = _FILE_CONFIG.get("ttl", 604800)                      # in seconds (0 to keep files forever)
+_FILE_SWEEP      = _FILE_CONFIG.get("sweep", 60)                        # in seconds
+_FILE_DIR        = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "files")
+
+# Stored file
+class StoredFile(object):
+    __slots__ = ("id", "hash", "name", "size", "owner", "created")
+
+    def __init__(self, id: str, hash: str, name: str, size: int, owner: str = None, created: float = None) -> None:
+        self.id = id
+        self.hash = hash
+        self.name = name
+        self.size = size
+        self.owner = owner
+        self.created = created or time.time()
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "hash": self.hash, "name": self.name, "size": self.size, "owner": self.owner, "created": self.created}
+
+# File store
+# Contents are stored once per SHA-256 under blobs/, and every file ID points
+# at one through an in-memory index; the index is also appended to index.jsonl,
+# which is how workers see each other's files (a lookup that misses reads
+# whatever other processes appended since the last one, deletions included)
+class FileStore(object):
+    def __init__(self, directory: str = _FILE_DIR, quota: int = _FILE_QUOTA, user_quota: int = _FILE_USER_QUOTA, ttl: float = _FILE_TTL) -> None:
+        self.lock = Lock()
+        self.directory = directory
+        self.blobs = os.path.join(directory, "blobs")
+        self.index_file = os.path.join(directory, "index.jsonl")
+
+        # Limits
+        self.quota = quota
+        self.user_quota = user_quota
+        self.ttl = ttl
+
+        # Index
+        self._files = {}    # id -> stored file
+        self._offset = 0    # How much of the index file has been read
+        self._refs = {}     # hash -> how many files point at it
+        self._usage = {}    # owner -> bytes
+        self.used = 0       # Bytes on disk (shared contents count once)
+
+        # Eviction
+        self._recent = OrderedDict()  # id -> None, least recently downloaded first
+        self._expiry = []             # Heap of (created, id), deleted files are skipped once they come up
+        self._wake = Event()
+
+        os.makedirs(self.blobs, exist_ok = True)
+        self.load()
+        self.compact()
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def __contains__(self, id: str) -> bool:
+        return self.get(id) is not None
+
+    # Index
+    def _insert(self, entry: StoredFile) -> None:
+        if entry.id in self._files:
+            return  # Our own append, read back
+
+        self._files[entry.id] = entry
+        self._recent[entry.id] = None
+        heapq.heappush(self._expiry, (entry.created, entry.id))
+
+        self._refs[entry.hash] = self._refs.get(entry.hash, 0) + 1
+        if self._refs[entry.hash] == 1:
+            self.used += entry.size
+
+        self._usage[entry.owner] = self._usage.get(entry.owner, 0) + entry.size
+
+    def _discard(self, id: str) -> StoredFile:
+        entry = self._files.pop(id, None)
+        if entry is None:
+            return None
+
+        del self._recent[id]
+        self._refs[entry.hash] -= 1
+        if not self._refs[entry.hash]:
+            del self._refs[entry.hash]
+            self.used -= entry.size
+
+        self._usage[entry.owner] -= entry.size
+        if not self._usage[entry.owner]:
+            del self._usage[entry.owner]
+
+        return entry
+
+    def _append(self, lines: list) -> None:
+        with open(self.index_file, "ab") as file:
+            file.write("".join(json.dumps(line) + "\n" for line in lines).encode("utf8"))
+
+    def load(self) -> None:
+        with self.lock:
+            try:
+                if os.path.getsize(self.index_file) == self._offset:
+                    return
+
+                with open(self.index_file, "rb") as file:
+                    file.seek(self._offset)
+                    for line in file:
+                        if not line.endswith(b"\n"):
+                            break  # Still being written
+
+                        self._offset += len(line)
+                        try:
+                            data = json.loads(line)
+                            if data.get("deleted"):
+                                self._discard(data["id"])
+
+                            else:
+                                self._insert(StoredFile(**data))
+
+                        except (ValueError, TypeError, KeyError):
+                            continue
+
+            except OSError:
+                return
+
+    def compact(self) -> None:
+        with self.lock:
+            with open(self.index_file + ".tmp", "w") as file:
+                file.write("".join(json.dumps(entry.to_dict()) + "\n" for entry in self._files.values()))
+
+            os.replace(self.index_file + ".tmp", self.index_file)
+            self._offset = os.path.getsize(self.index_file)
+
+    def get(self, id: str) -> StoredFile:
+        entry = self._files.get(id)
+        if entry is None:
+            self.load()
+            entry = self._files.get(id)
+
+        return entry
+
+    def touch(self, entry: StoredFile) -> None:
+        with self.lock:
+            if entry.id in self._recent:
+                self._recent.move_to_end(entry.id)
+
+    def path(self, entry: StoredFile) -> str:
+        return os.path.join(self.blobs, entry.hash)
+
+    def valid_id(self, id: str) -> bool:
+        return len(id) == 8 and id.isascii() and id.isalpha()  # What generate_id makes, so it's always safe in a path
+
+    def generate_id(self) -> str:
+        while True:
+            id = "".join(random.choice(string.ascii_letters) for _ in range(8))
+            if id not in self and not os.path.isfile(os.path.join(self.directory, f"{id}.upload")):
+                return id
+
+    # Quotas
+    def usage(self, owner: str) -> int:
+        return self._usage.get(owner, 0)
+
+    def fits(self, owner: str, size: int) -> bool:
+        if self.quota and size > self.quota:
+            return False
+
+        return not self.user_quota or self.usage(owner) + size <= self.user_quota
+
+    # Files
+    def add(self, id: str, name: str, digest: str, path: str, owner: str = None) -> StoredFile:
+        entry = StoredFile(id, digest, name, os.path.getsize(path), owner)
+        with self.lock:
+            if os.path.isfile(self.path(entry)):
+                os.remove(path)  # Same contents are already stored
+
+            else:
+                os.replace(path, self.path(entry))
+
+            self._append([entry.to_dict()])
+            self._insert(entry)
+
+        # Make room right away instead of on the next sweep
+        if self.quota and self.used > self.quota:
+            self._wake.set()
+
+        return entry
+
+    def write(self, id: str, name: str, data: bytes, owner: str = None) -> StoredFile:
+        path = os.path.join(self.directory, f"{id}.part")
+        with open(path, "wb") as file:
+            file.write(data)
+
+        return self.add(id, name, hashlib.sha256(data).hexdigest(), path, owner)
+
+    # Eviction
+    def _evict(self, id: str, removed: list) -> None:
+        entry = self._discard(id)
+        removed.append({"id": id, "deleted": True})
+        if entry.hash not in self._refs:
+            try:
+                os.remove(self.path(entry))
+
+            except FileNotFoundError:
+                pass  # Another worker got to it first
+
+    def sweep(self) -> int:
+        self.load()  # Pick up files (and deletions) from other workers first
+        removed, now = [], time.time()
+        with self.lock:
+
+            # Expired files, oldest first
+            while self.ttl and self._expiry and self._expiry[0][0] + self.ttl <= now:
+                created, id = heapq.heappop(self._expiry)
+                if id in self._files and self._files[id].created == created:
+                    self._evict(id, removed)
+
+            # Least recently downloaded files, until the store fits its quota
+            while self.quota and self.used > self.quota and self._recent:
+                self._evict(next(iter(self._recent)), removed)
+
+            if len(self._expiry) > 2 * len(self._files) + 64:
+                self._expiry = [(entry.created, entry.id) for entry in self._files.values()]
+                heapq.heapify(self._expiry)
+
+            if removed:
+                self._append(removed)
+
+        # Uploads nobody came back to finish
+        if self.ttl:
+            for item in os.scandir(self.directory):
+                if item.name.endswith((".upload", ".part")) and item.stat().st_mtime + self.ttl <= now:
+                    try:
+                        os.remove(item.path)
+
+                    except FileNotFoundError:
+                        pass
+
+        return len(removed)
+
+    def start(self, interval: float = _FILE_SWEEP) -> None:
+        if self.quota or self.ttl:
+            Thread(target = self._sweeper, args = (interval,), daemon = True).start()
+
+    def _sweeper(self, interval: float) -> None:
+        while True:
+            self._wake.wait(interval)
+            self._wake.clear()
+            self.sweep()
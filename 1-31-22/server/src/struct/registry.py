@@ -0,0 +1,125 @@
+# Copyright 2021 iiPython
+
+# Modules
+from threading import RLock
+from itertools import count
+
+# Registry entry
+class Entry(object):
+    __slots__ = ("client", "cid", "uid", "name")
+
+    def __init__(self, client, cid: int) -> None:
+        self.client = client
+        self.cid = cid
+        self.uid = None
+        self.name = None
+
+# Client registry
+# Lookups by connection id, uid and (case folded) name are O(1); readers that
+# only need to iterate (broadcast, to_dict) use snapshot(), which is rebuilt
+# lazily after a change so they never need the lock
+class ClientRegistry(object):
+    def __init__(self) -> None:
+        self.lock = RLock()
+        self.version = 0  # Roster version, bumped whenever an authed client joins/leaves
+
+        self._ids = count(1)
+
+        # Indexes
+        self._entries = {}  # client -> entry
+        self._by_cid = {}
+        self._by_uid = {}
+        self._by_name = {}
+
+        self._snapshot = ()
+        self._authed = ()
+        self._stale = False
+
+    def __len__(self) -> int:
+        return len(self._by_cid)
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __contains__(self, client) -> bool:
+        return client in self._entries
+
+    # Modification
+    def add(self, client) -> int:
+        with self.lock:
+            entry = Entry(client, next(self._ids))
+            self._entries[client] = entry
+            self._by_cid[entry.cid] = entry
+            self._stale = True
+
+            return entry.cid
+
+    def claim(self, client, name: str, uid: str) -> bool:
+        key = name.casefold()
+        with self.lock:
+            entry = self._entries.get(client)
+            if entry is None or key in self._by_name:
+                return False
+
+            entry.name, entry.uid = key, uid
+            self._by_name[key] = entry
+            self._by_uid[uid] = entry
+            self._stale = True
+
+            self.version += 1
+            return True
+
+    def remove(self, client) -> bool:
+        with self.lock:
+            entry = self._entries.pop(client, None)
+            if entry is None:
+                return False
+
+            del self._by_cid[entry.cid]
+            self._stale = True
+            if entry.name is None:
+                return False
+
+            del self._by_name[entry.name]
+            del self._by_uid[entry.uid]
+
+            self.version += 1
+            return True  # Client was on the roster
+
+    # Lookups
+    def by_cid(self, cid: int):
+        entry = self._by_cid.get(cid)
+        return entry and entry.client
+
+    def by_uid(self, uid: str):
+        entry = self._by_uid.get(uid)
+        return entry and entry.client
+
+    def by_name(self, name: str):
+        entry = self._by_name.get(name.casefold())
+        return entry and entry.client
+
+    def cid(self, client) -> int:
+        entry = self._entries.get(client)
+        return entry and entry.cid
+
+    # Snapshots
+    def _refresh(self) -> None:
+        with self.lock:
+            if self._stale:
+                entries = tuple(self._by_cid.values())
+                self._snapshot = tuple(entry.client for entry in entries)
+                self._authed = tuple(entry.client for entry in entries if entry.name is not None)
+                self._stale = False
+
+    def snapshot(self) -> tuple:
+        if self._stale:
+            self._refresh()
+
+        return self._snapshot
+
+    def authed(self) -> tuple:
+        if self._stale:
+            self._refresh()
+
+        return self._authed
@@ -0,0 +1,150 @@
+# Copyright 2021 iiPython
+
+# Modules
+import os
+import json
+import hashlib
+from threading import Lock
+
+from ..core.config import config
+from .files import FileStore
+
+# Configuration
+_FILE_CONFIG = config.get("files") or {}
+_FILE_CHUNK  = int(_FILE_CONFIG.get("chunk", 64) * 1024)      # in Kilobytes
+_FILE_SIZE   = int(_FILE_CONFIG.get("size", 100) * 1048576)   # in Megabytes
+
+# Upload
+class Upload(object):
+    __slots__ = ("id", "name", "size", "chunk", "owner", "received", "file", "hash")
+
+    def __init__(self, id: str, name: str, size: int, chunk: int, owner: str) -> None:
+        self.id = id
+        self.name = name
+        self.size = size
+        self.chunk = chunk
+        self.owner = owner
+
+        self.received = 0
+        self.file = None
+        self.hash = hashlib.sha256()  # Updated as chunks arrive, so finishing never rereads the file
+
+    def next(self) -> int:
+        return self.received // self.chunk
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "size": self.size, "chunk": self.chunk, "owner": self.owner}
+
+# Upload registry
+# Chunks are written to <id>.part as they arrive, next to a small <id>.upload
+# file describing the upload; only uploads with an open file are kept in
+# memory, so a client that reconnects (even to another worker) resumes from
+# what made it to disk; finished uploads go to the file store
+class UploadRegistry(object):
+    def __init__(self, store: FileStore, chunk: int = _FILE_CHUNK, limit: int = _FILE_SIZE) -> None:
+        self.lock = Lock()
+        self.store = store
+        self.directory = store.directory
+        self.chunk = chunk
+        self.limit = limit
+
+        self._uploads = {}  # id -> upload
+
+    def _path(self, id: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{id}.{extension}")
+
+    # Uploads
+    def begin(self, owner: str, name: str, size: int, chunk: int = None) -> Upload:
+        if not 0 < size <= self.limit:
+            raise self.UploadError(f"File limit is {self.limit} bytes.")
+
+        with self.lock:
+            pending = sum(upload.size for upload in self._uploads.values() if upload.owner == owner)
+            if not self.store.fits(owner, pending + size):
+                raise self.UploadError(f"Not enough room, you have {self.store.usage(owner)} bytes stored already.")
+
+            upload = Upload(self.store.generate_id(), name, size, chunk or self.chunk, owner)
+            with open(self._path(upload.id, "upload"), "w") as file:
+                file.write(json.dumps(upload.to_dict()))
+
+            upload.file = open(self._path(upload.id, "part"), "wb")
+            self._uploads[upload.id] = upload
+            return upload
+
+    def resume(self, owner: str, id: str) -> Upload:
+        if not self.store.valid_id(id):
+            raise self.UploadError("No upload to resume with that ID.")  # Checked before it's ever part of a path
+
+        with self.lock:
+            upload = self._uploads.get(id)
+            if upload is None:
+                try:
+                    with open(self._path(id, "upload"), "r") as file:
+                        upload = Upload(**json.loads(file.read()))
+
+                except (OSError, ValueError, TypeError):
+                    raise self.UploadError("No upload to resume with that ID.")
+
+            if upload.owner != owner:
+                raise self.UploadError("No upload to resume with that ID.")
+
+            # Only whole chunks count, one cut off by the disconnect gets sent again
+            if upload.file is not None:
+                upload.file.close()
+
+            try:
+                upload.file = open(self._path(id, "part"), "r+b")
+
+            except OSError:
+                raise self.UploadError("No upload to resume with that ID.")
+
+            upload.received = min(os.fstat(upload.file.fileno()).st_size, upload.size) // upload.chunk * upload.chunk
+            upload.file.truncate(upload.received)
+
+            # The hash doesn't survive a disconnect, so catch up on what's already there
+            upload.hash = hashlib.sha256()
+            upload.file.seek(0)
+            for _ in range(upload.received // upload.chunk):
+                upload.hash.update(upload.file.read(upload.chunk))
+
+            self._uploads[id] = upload
+            return upload
+
+    def get(self, owner: str, id: str) -> Upload:
+        upload = self._uploads.get(id)
+        if upload is None or upload.owner != owner or upload.file is None:
+            raise self.UploadError("No upload in progress with that ID.")
+
+        return upload
+
+    def write(self, upload: Upload, index: int, data: bytes) -> None:
+        if index != upload.next():
+            raise self.UploadError(f"Expected chunk {upload.next()}, got {index}.")
+
+        elif len(data) != min(upload.chunk, upload.size - upload.received):
+            raise self.UploadError(f"Chunk {index} has the wrong size.")
+
+        upload.file.write(data)
+        upload.hash.update(data)
+        upload.received += len(data)
+
+    def finish(self, upload: Upload) -> Upload:
+        if upload.received != upload.size:
+            raise self.UploadError(f"Upload is incomplete, expected chunk {upload.next()} next.")
+
+        with self.lock:
+            upload.file.close()
+            self.store.add(upload.id, upload.name, upload.hash.hexdigest(), self._path(upload.id, "part"), upload.owner)
+            os.remove(self._path(upload.id, "upload"))
+            del self._uploads[upload.id]
+            return upload
+
+    def detach(self, owner: str) -> None:
+        with self.lock:
+            for upload in [upload for upload in self._uploads.values() if upload.owner == owner]:
+                upload.file.close()
+                del self._uploads[upload.id]  # Stays on disk for the owner to resume
+
+    # Exceptions
+    class UploadError(Exception):
+        pass